@@ -0,0 +1,80 @@
+"""
+Debug artifacts for the Auto-SBC project
+"""
+import os
+import queue
+import threading
+
+from .logger import current_stream_id
+
+# Opt-in, solves write no debug artifacts unless AUTOSBC_DEBUG_ARTIFACTS is set
+DEBUG_ARTIFACTS = os.environ.get("AUTOSBC_DEBUG_ARTIFACTS", "").lower() in ("1", "true", "yes")
+# Each solve writes its artifacts to DEBUG_DIR/<job id>/
+DEBUG_DIR = os.environ.get("AUTOSBC_DEBUG_DIR", "debug")
+# Club players of the latest uploaded roster, served to the userscript by GET /allPlayers.csv
+CLUB_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "allPlayers.csv")
+
+
+class ArtifactWriter(threading.Thread):
+    """Write queued DataFrames to CSV files off the solve thread"""
+
+    def __init__(self):
+        super().__init__(name="debug-artifact-writer", daemon=True)
+        self.queue = queue.SimpleQueue()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            path, frame = item
+            # Write next to the target and swap it in, so readers never see a partial file
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                frame.to_csv(temp_path)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"Could not write {path}: {e}")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _artifact_writer():
+    """Start the background artifact writer on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ArtifactWriter()
+                _writer.start()
+    return _writer
+
+
+# Function to save a DataFrame of the current solve for debugging
+def dump(frame, name):
+    """Queue frame to be written as DEBUG_DIR/<job id>/<name>.csv, a no-op unless debug artifacts are enabled"""
+    if not DEBUG_ARTIFACTS:
+        return
+    path = os.path.join(DEBUG_DIR, current_stream_id(), f"{name}.csv")
+    # Copy so later changes by the solve don't race the writer
+    _artifact_writer().queue.put((path, frame.copy()))
+
+
+# Function to save the club players for GET /allPlayers.csv
+def save_club(frame):
+    """Queue frame to replace CLUB_CSV, written whenever a roster is uploaded or changed"""
+    # Roster updates build a new frame, so the writer can keep this one
+    _artifact_writer().queue.put((CLUB_CSV, frame.reset_index(drop=True)))
+
+
+def flush_artifacts(timeout=5):
+    """Wait until the artifacts queued so far have been written"""
+    if _writer is None:
+        return True
+    done = threading.Event()
+    _writer.queue.put(done)
+    return done.wait(timeout)
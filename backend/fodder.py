@@ -0,0 +1,88 @@
+"""
+Rating fodder packing for the Auto-SBC project
+"""
+import heapq
+import itertools
+import time
+
+from .logger import add_log
+from . import rating_dp
+
+
+def fodder_targets(targets):
+    """Squad ratings to pack, highest first, from a list of {"rating", "count", "minRating"}.
+
+    minRating leaves out the cards rated below it, for SBCs that also ask
+    every player to reach a rating. Invalid targets are logged and skipped.
+    """
+    squads = []
+    for target in targets:
+        try:
+            rating = float(target["rating"])
+            count = int(target.get("count", 1))
+            min_rating = int(target.get("minRating") or 0)
+        except (KeyError, TypeError, ValueError):
+            add_log(f"Ignoring invalid fodder target {target}")
+            continue
+        squads += [(rating, min_rating)] * max(0, count)
+    return sorted(squads, reverse=True)
+
+
+def _cheapest_squad(pool, squad_rating, num_players):
+    """Rows of the cheapest squad of differently named cards in pool, None if there is none.
+
+    The rating DP ignores names, so when its squad repeats a player the
+    search branches on which card of that player, if any, may be used.
+    Branches are solved cheapest first, and the DP cost of a branch is a
+    lower bound of its squads, so the first squad that repeats no player
+    is the cheapest one.
+    """
+    branches = []
+    order = itertools.count()
+
+    def branch(cards):
+        rows = rating_dp.cheapest_squad(cards, squad_rating, num_players)
+        if rows is not None:
+            heapq.heappush(branches, (cards.loc[rows, "price"].sum(), next(order), cards, rows))
+
+    branch(pool)
+    while branches:
+        _, _, cards, rows = heapq.heappop(branches)
+        names = cards.loc[rows, "name"]
+        repeated = names[names.duplicated()]
+        if len(repeated) == 0:
+            return rows
+        versions = cards.index[cards["name"] == repeated.iloc[0]]
+        branch(cards.drop(versions))
+        for row in versions:
+            branch(cards.drop(versions.drop(row)))
+    return None
+
+
+# Function to spend a club on many rating squads
+def pack_fodder(df, targets, num_players=11):
+    """Pack the cards of df into a squad for each (rating, minRating) target.
+
+    Targets are packed highest first, so the scarce high rated cards go to
+    the squads that need them. Each squad is the cheapest one the rating DP
+    finds among the cards the squads before it left, so no card is used
+    twice. Returns the rows of each squad, None when the cards left can't
+    reach its rating.
+    """
+    start = time.time()
+    cards = df[["name", "rating", "price"]]
+    used = set()
+    squads = []
+    for squad_rating, min_rating in targets:
+        pool = cards[~cards.index.isin(used)]
+        if min_rating:
+            pool = pool[pool["rating"] >= min_rating]
+        rows = _cheapest_squad(pool, squad_rating, num_players)
+        if rows is None:
+            add_log(f"No cards left for a {squad_rating} squad")
+        else:
+            used.update(rows)
+        squads.append(rows)
+    packed = sum(1 for rows in squads if rows is not None)
+    add_log(f"Packed {packed} of {len(targets)} fodder squads in {round(time.time() - start, 2)}s")
+    return squads
@@ -0,0 +1,138 @@
+"""
+Background solve jobs for the Auto-SBC project
+"""
+import threading
+import time
+import uuid
+
+from . import logger
+
+# Finished jobs kept around for polling before the oldest are dropped
+MAX_FINISHED_JOBS = 100
+
+# Jobs by id, kept in memory only, so a server restart loses them
+jobs = {}
+jobs_lock = threading.Lock()
+
+
+class SolveJob:
+    """A solve request running in the background"""
+
+    def __init__(self, request_data):
+        self.id = uuid.uuid4().hex
+        self.request_data = request_data
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.callback = None
+        self.cancel_event = None
+        self._lock = threading.Lock()
+
+    def attach_callback(self, callback):
+        """Register the CP-SAT solution callback, returns False if the job was cancelled"""
+        with self._lock:
+            self.callback = callback
+            return not self.cancel_requested
+
+    def attach_cancel_event(self, cancel_event):
+        """Register the event a solver process watches to stop its search"""
+        with self._lock:
+            self.cancel_event = cancel_event
+            if self.cancel_requested:
+                cancel_event.set()
+
+    def cancelled(self):
+        """Whether the job has been asked to stop"""
+        return self.cancel_requested
+
+    def cancel(self):
+        """Stop the job, interrupting the CP-SAT search if it is running"""
+        with self._lock:
+            if self.status in ("completed", "failed", "cancelled"):
+                return False
+            self.cancel_requested = True
+            if self.status == "queued":
+                self.status = "cancelled"
+                self.finished = time.time()
+                # The job never runs, so close its stream for the clients listening to it
+                logger.end_stream(self.id)
+            elif self.cancel_event is not None:
+                self.cancel_event.set()
+            elif self.callback is not None:
+                self.callback.StopSearch()
+        return True
+
+    def run(self, func):
+        """Run func(request_data, job=self) and record its outcome"""
+        with self._lock:
+            if self.cancel_requested:
+                return
+            self.status = "running"
+            self.started = time.time()
+        try:
+            result = func(self.request_data, job=self)
+            with self._lock:
+                self.result = result
+                self.status = "cancelled" if self.cancel_requested else "completed"
+        except Exception as e:
+            with self._lock:
+                self.error = str(e)
+                self.status = "failed"
+        finally:
+            self.finished = time.time()
+            self.request_data = None  # Free the club payload
+
+    def best(self):
+        """Cheapest solution found so far, like /solver-best"""
+        stream = logger.get_stream(self.id)
+        if stream is None:
+            return None
+        with stream.lock:
+            entry = stream.best
+        if entry is None:
+            return None
+        return {
+            "solution_number": entry["event"]["solution_number"],
+            "objective_value": entry["event"]["objective_value"],
+            "time": entry["time"],
+        }
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "best": self.best(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def submit(executor, func, request_data):
+    """Queue a solve job on the executor and return it immediately"""
+    job = SolveJob(request_data)
+    with jobs_lock:
+        jobs[job.id] = job
+        _prune()
+    logger.open_stream(job.id)
+    executor.submit(job.run, func)
+    return job
+
+
+def get(job_id):
+    with jobs_lock:
+        return jobs.get(job_id)
+
+
+def _prune():
+    """Drop the oldest finished jobs beyond MAX_FINISHED_JOBS"""
+    finished = [job for job in jobs.values() if job.finished is not None]
+    finished.sort(key=lambda job: job.finished)
+    for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del jobs[job.id]
@@ -4,50 +4,309 @@ Shared global variables for the Auto-SBC project
 import time
 import json
 import os
-import csv
-# Initialize an empty list for solver logs
-solver_logs = []
+import atexit
+import itertools
+import queue
+import threading
+from collections import OrderedDict, deque
+
+# Most recent entries kept for each solve
+MAX_LOG_ENTRIES = 2000
+# Most recent solves whose logs are kept
+MAX_LOG_STREAMS = 20
+DEFAULT_STREAM = "default"
+
+# Log file, rotated to solver_log_<ms>.jsonl once it passes MAX_LOG_FILE_BYTES
+LOG_DIR = "logs"
+LOG_FILE = "solver_log.jsonl"
+MAX_LOG_FILE_BYTES = 10 * 1024 * 1024
+# The writer thread flushes at most this often and this many entries at a time
+LOG_FLUSH_INTERVAL = 0.5
+LOG_BATCH_SIZE = 500
+
+# Log streams keyed by solve id, oldest first
+log_streams = OrderedDict()
+latest_stream = None
+_streams_lock = threading.Lock()
+# Sequence numbers are shared by all streams so a client can keep polling
+# with the last seq it saw even when a new solve starts
+_seq = itertools.count(1)
+_current = threading.local()
+# Set in solver processes, whose entries are recorded by the server process
+_forward_queue = None
+
+
+class LogStream:
+    """Bounded ring buffer of log entries for a single solve"""
+
+    def __init__(self, stream_id):
+        self.id = stream_id
+        self.entries = deque(maxlen=MAX_LOG_ENTRIES)
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.closed = False
+        # Kept apart from the ring buffer, which long solves overflow
+        self.last_events = {}  # Latest entry of each event type
+        self.best = None  # Cheapest solution entry and its decoded squad
+        self.best_squad = None
+
+    def append(self, entry):
+        with self.lock:
+            entry["seq"] = next(_seq)
+            self.entries.append(entry)
+            event = entry.get("event")
+            if event is not None:
+                self._track(entry, event)
+            self._notify(entry)
+
+    def _track(self, entry, event):
+        """Remember the latest event of each type and the cheapest solution"""
+        self.last_events[event.get("type")] = entry
+        if event.get("type") == "solution":
+            # Later solutions win ties, CP-SAT improves on the warm start squad
+            if self.best is None or event["objective_value"] <= self.best["event"]["objective_value"]:
+                self.best = entry
+                self.best_squad = event.get("squad")
+        elif event.get("type") == "squad":
+            # Squads are decoded after their solution event
+            if self.best is not None and self.best_squad is None and event["solution_number"] == self.best["event"]["solution_number"]:
+                self.best_squad = event["squad"]
+
+    def since(self, seq):
+        with self.lock:
+            return [entry for entry in self.entries if entry["seq"] > seq]
+
+    def subscribe(self, listener, seq):
+        """Call listener(entry) for every new entry, returns the entries after seq and whether the solve has finished"""
+        with self.lock:
+            self.listeners.append(listener)
+            return [entry for entry in self.entries if entry["seq"] > seq], self.closed
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def close(self):
+        """Mark the solve as finished, listeners are called with None"""
+        with self.lock:
+            self.closed = True
+            self._notify(None)
+
+    def _notify(self, entry):
+        for listener in self.listeners:
+            try:
+                listener(entry)
+            except RuntimeError:
+                # The listener's event loop has already shut down
+                pass
+
+
+def _get_stream(stream_id, create=True):
+    """Return the stream for stream_id, creating it if needed unless create is False"""
+    with _streams_lock:
+        stream = log_streams.get(stream_id)
+        if stream is None and create:
+            stream = log_streams[stream_id] = LogStream(stream_id)
+            while len(log_streams) > MAX_LOG_STREAMS:
+                log_streams.popitem(last=False)
+        return stream
+
+
+# Function to start logging a new solve on this thread
+def start_stream(stream_id):
+    """Route add_log calls made on this thread to the stream of stream_id"""
+    global latest_stream
+    if _forward_queue is None:
+        _get_stream(stream_id).closed = False
+        latest_stream = stream_id
+    _current.stream_id = stream_id
+
+
+def open_stream(stream_id):
+    """Create the stream of a queued solve, so clients can subscribe before it starts"""
+    if _forward_queue is None:
+        _get_stream(stream_id)
+
+
+def end_stream(stream_id):
+    """Tell the listeners of stream_id that its solve has finished"""
+    record_log(stream_id, None)
+
+
+def forward_logs(log_queue):
+    """Send (stream_id, entry) pairs to log_queue instead of recording them, used in solver processes"""
+    global _forward_queue
+    _forward_queue = log_queue
+
+
+def get_stream(stream_id=None):
+    """Stream of stream_id, the latest solve by default, None if there is no such solve"""
+    return _get_stream(stream_id or latest_stream or DEFAULT_STREAM, create=False)
+
+
+def current_stream_id():
+    """Id of the stream add_log writes to on this thread"""
+    return getattr(_current, "stream_id", DEFAULT_STREAM)
+
 
 # Function to add a log entry
-def add_log(message,result = []):
-    """Add a log entry with current timestamp"""
+def add_log(message,result = [], stream_id=None, event=None):
+    """Add a log entry with current timestamp, event holds extra fields of structured entries"""
 
     log_entry = {
         "time": time.time(),
         "message": message,
         "result": result
     }
-    solver_logs.append(log_entry)
-    
-    # Save log to file
-    
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-        
-    log_file = os.path.join(log_dir, f"solver_log.csv")
-    with open(log_file, 'w', newline='', encoding='utf-8') as f:
-        csv_writer = csv.writer(f)
-        # Write header
-        csv_writer.writerow(["time", "message", "result"])
-        # Write data
-        for entry in solver_logs:
-            csv_writer.writerow([
-                entry['time'], 
-                entry['message'], 
-                json.dumps(entry['result'])  # Convert complex result to string
-            ])
+    if event is not None:
+        log_entry["event"] = event
+    # Solver callbacks run on CP-SAT threads, so they pass their stream explicitly
+    record_log(stream_id or current_stream_id(), log_entry)
+
+
+def record_log(stream_id, log_entry):
+    """Add log_entry to the stream of stream_id, None marks the end of the solve"""
+    if _forward_queue is not None:
+        _forward_queue.put((stream_id, log_entry))
+        return
+    stream = _get_stream(stream_id)
+    if log_entry is None:
+        stream.close()
+        return
+    stream.append(log_entry)
+
+    # Save log to file in the background, never blocking the caller
+    _log_writer().queue.put((stream.id, log_entry))
+
+
+class LogWriter(threading.Thread):
+    """Append queued log entries to a JSON lines file in batches"""
+
+    def __init__(self):
+        super().__init__(name="solver-log-writer", daemon=True)
+        self.queue = queue.SimpleQueue()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            # Collect whatever else arrives within the flush interval
+            deadline = time.time() + LOG_FLUSH_INTERVAL
+            while len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        flushed = [item for item in batch if isinstance(item, threading.Event)]
+        entries = [item for item in batch if not isinstance(item, threading.Event)]
+        try:
+            if entries:
+                log_file = _rotated_log_file()
+                with open(log_file, 'a', encoding='utf-8') as f:
+                    for stream_id, entry in entries:
+                        f.write(json.dumps({"job": stream_id, **entry}, default=str) + "\n")
+        except OSError as e:
+            print(f"Could not write solver logs: {e}")
+        for event in flushed:
+            event.set()
+
+
+def _rotated_log_file():
+    """Path of the log file, moving it aside once it grows past MAX_LOG_FILE_BYTES"""
+    if not os.path.exists(LOG_DIR):
+        os.makedirs(LOG_DIR)
+    log_file = os.path.join(LOG_DIR, LOG_FILE)
+    if os.path.exists(log_file) and os.path.getsize(log_file) > MAX_LOG_FILE_BYTES:
+        os.replace(log_file, os.path.join(LOG_DIR, f"solver_log_{int(time.time() * 1000)}.jsonl"))
+    return log_file
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _log_writer():
+    """Start the background log writer on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = LogWriter()
+                _writer.start()
+                atexit.register(flush_logs)
+    return _writer
+
+
+def flush_logs(timeout=5):
+    """Wait until the entries queued so far have been written to file"""
+    if _writer is None:
+        return True
+    done = threading.Event()
+    _writer.queue.put(done)
+    return done.wait(timeout)
+
+
+# Function to read the logs of a solve
+def get_logs(stream_id=None, since=0):
+    """Entries of a solve with a seq greater than since, the latest solve by default"""
+    stream_id = stream_id or latest_stream or DEFAULT_STREAM
+    with _streams_lock:
+        stream = log_streams.get(stream_id)
+    logs = stream.since(since) if stream is not None else []
+    return {
+        "job": stream_id,
+        "logs": logs,
+        "next": logs[-1]["seq"] if logs else since,
+    }
+
+
+def last_event(stream_id, event_type):
+    """Most recent entry of stream_id with the given event type"""
+    with _streams_lock:
+        stream = log_streams.get(stream_id)
+    if stream is None:
+        return None
+    with stream.lock:
+        return stream.last_events.get(event_type)
+
+
+def best_solution(stream_id=None):
+    """Cheapest squad found so far by a solve, the latest solve by default, None if there is no such solve"""
+    stream = get_stream(stream_id)
+    if stream is None:
+        return None
+    with stream.lock:
+        best, squad = stream.best, stream.best_squad
+    return {
+        "job": stream.id,
+        "finished": stream.closed,
+        "best": None if best is None else {
+            "solution_number": best["event"]["solution_number"],
+            "objective_value": best["event"]["objective_value"],
+            "elapsed": best["event"]["elapsed"],
+            "time": best["time"],
+            "results": squad,
+        },
+    }
+
 
 # Function to clear logs
 def clear_logs():
     """Clear all logs"""
-    global solver_logs
-    
+    global latest_stream
+
     # Delete log files in the log directory
-    log_dir = "logs"
-    if os.path.exists(log_dir):
-        for file in os.listdir(log_dir):
+    if os.path.exists(LOG_DIR):
+        for file in os.listdir(LOG_DIR):
             if file.startswith("solver_log_"):
-                os.remove(os.path.join(log_dir, file))
-    
-    solver_logs = []
+                os.remove(os.path.join(LOG_DIR, file))
+
+    with _streams_lock:
+        log_streams.clear()
+        latest_stream = None
@@ -1,11 +1,18 @@
 from fastapi.middleware.cors import CORSMiddleware
 import time
 import json
-from fastapi import Request, FastAPI, BackgroundTasks
+import uuid
+from fastapi import Request, FastAPI, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
+from . import artifacts
+from . import jobs
+from . import roster
 from . import setup
+from . import solver_pool
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import functools
+import multiprocessing
 import signal
 import sys
 import uvicorn
@@ -22,6 +29,8 @@ logging.basicConfig(
 # Global variables
 app = FastAPI()
 thread_pool = ThreadPoolExecutor(max_workers=10)
+# Jobs wait for their solver process on threads of their own, so they don't hold up the other endpoints
+job_pool = ThreadPoolExecutor(max_workers=max(1, solver_pool.SOLVER_PROCESSES), thread_name_prefix="solve-job")
 shutdown_event = asyncio.Event()
 
 # Configure CORS
@@ -66,6 +75,8 @@ async def shutdown():
     
     # Don't wait for all tasks - faster shutdown for reloads
     thread_pool.shutdown(wait=False)
+    job_pool.shutdown(wait=False, cancel_futures=True)
+    solver_pool.shutdown()
     
     # Force terminate the process
     import os
@@ -81,50 +92,190 @@ async def app_shutdown():
     await shutdown()
 
 # Synchronous function that will be run in a thread
-def get_logs():
-    # Return the logs from the shared module
-    return {"logs": logger.solver_logs}
+def get_logs(job=None, since=0):
+    # Return the new logs of a solve from the shared module
+    return logger.get_logs(job, since)
 
 @app.get('/solver-logs')
-async def get_solver_logs():
+async def get_solver_logs(job: str = None, since: int = 0):
     # Run the blocking operation in a separate thread
-    return await run_in_threadpool(get_logs)()
+    return await run_in_threadpool(get_logs)(job, since)
+
+def format_solver_event(entry):
+    """Format a log entry as a Server-Sent Event"""
+    event = entry.get("event") or {}
+    return f"id: {entry['seq']}\nevent: {event.get('type', 'log')}\ndata: {json.dumps(entry, default=str)}\n\n"
+
+async def solver_event_stream(stream, since):
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def listener(entry):
+        loop.call_soon_threadsafe(events.put_nowait, entry)
+
+    backlog, closed = stream.subscribe(listener, since)
+    try:
+        for entry in backlog:
+            since = entry["seq"]
+            yield format_solver_event(entry)
+        while not closed:
+            try:
+                entry = await asyncio.wait_for(events.get(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if entry is None:
+                break
+            if entry["seq"] > since:
+                since = entry["seq"]
+                yield format_solver_event(entry)
+        yield f"event: done\ndata: {json.dumps({'job': stream.id})}\n\n"
+    finally:
+        stream.unsubscribe(listener)
+
+@app.get('/solver-events')
+async def get_solver_events(request: Request, job: str = None, since: int = 0):
+    # Push log lines and improving solutions of a solve as they happen
+    last_event_id = request.headers.get('last-event-id')
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    # Unknown solves would keep the connection open forever
+    stream = logger.get_stream(job)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Solve not found")
+    return StreamingResponse(
+        solver_event_stream(stream, since),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+def get_best_solution(job=None):
+    # Return the cheapest squad found so far by a solve
+    return logger.best_solution(job)
+
+@app.get('/solver-best')
+async def get_solver_best(job: str = None):
+    # Accept a good enough squad without waiting for the solve to finish
+    best = await run_in_threadpool(get_best_solution)(job)
+    # Unknown or expired solves aren't solves without a squad yet
+    if best is None:
+        raise HTTPException(status_code=404, detail="Solve not found")
+    return best
 
 # Synchronous function that will be run in a thread
-def process_solve_request(request_data):
-    # Use the globals module
-    logger.clear_logs()  # Clear previous logs
-    logger.add_log("SBC Solver started in thread")
-    
-    sbcData = request_data['sbcData']
-    clubPlayers = request_data['clubPlayers']
-    maxSolveTime = request_data['maxSolveTime']
-    
-    # Log received data
-    logger.add_log(f"Processing {len(clubPlayers)} players, max time: {maxSolveTime}s")
-    
+def process_solve_request(request_data, job=None):
+    # Log this solve to its own stream, keyed by the job id or the client's solveId
+    if job is not None:
+        stream_id = job.id
+    else:
+        stream_id = request_data.get('solveId') or uuid.uuid4().hex
+    # Use the cached roster when the request references one instead of sending clubPlayers
     try:
-        result = setup.runAutoSBC(sbcData, clubPlayers, maxSolveTime)
-        
-        # Log completion
-        logger.add_log("Solver thread completed successfully")
-        
-        return result
-    except Exception as e:
-        # Log errors
-        logger.add_log(f"Error in solver thread: {str(e)}")
-        raise e
+        players, roster_key = roster.resolve_players(request_data)
+        request_data = {**request_data, 'clubPlayers': players, 'rosterKey': roster_key}
+    except roster.RosterError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Build and solve the model in a solver process
+    return solver_pool.run(request_data, stream_id, job)
 
 @app.post('/solve')
 async def get_body(request: Request):
-    # Parse the request data and clear logs on new solve
+    # Parse the request data
     request_data = await request.json()
-    logger.clear_logs()  # Clear previous logs
-    
+
     # Run the CPU-intensive task in a thread pool
     result = await run_in_threadpool(process_solve_request)(request_data)
     return result
 
+@app.post('/solve-batch')
+async def solve_batch(request: Request):
+    # Solve every SBC of a group on one club, without using a card twice
+    request_data = await request.json()
+    if not request_data.get('sbcBatch'):
+        raise HTTPException(status_code=422, detail="sbcBatch must list the SBCs to solve")
+    result = await run_in_threadpool(process_solve_request)(request_data)
+    return result
+
+def process_fodder_request(request_data):
+    # The rating DP packs the club in seconds, so it runs in the server process
+    try:
+        players, _ = roster.resolve_players(request_data)
+    except roster.RosterError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return setup.runFodderPacking(request_data['fodderTargets'], players)
+
+@app.post('/pack-fodder')
+async def pack_fodder(request: Request):
+    # Spend the club on many rating squads, without using a card twice
+    request_data = await request.json()
+    if not request_data.get('fodderTargets'):
+        raise HTTPException(status_code=422, detail="fodderTargets must list the squad ratings to pack")
+    return await run_in_threadpool(process_fodder_request)(request_data)
+
+@app.post('/jobs')
+async def submit_solve_job(request: Request):
+    # Queue the solve and return straight away, poll GET /jobs/{job_id} for the result
+    if shutdown_event.is_set():
+        logging.warning("Server is shutting down, rejecting new requests")
+        raise RuntimeError("Server is shutting down")
+    request_data = await request.json()
+    job = jobs.submit(job_pool, process_solve_request, request_data)
+    return {"job_id": job.id, "status": job.status}
+
+@app.get('/jobs/{job_id}')
+async def get_solve_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.delete('/jobs/{job_id}')
+async def cancel_solve_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.cancel()
+    return {"job_id": job.id, "status": job.status}
+
+# Club roster cache, so solves can skip uploading and normalizing the club
+def put_roster_handler(roster_id, body):
+    cached = roster.put(roster_id, body['version'], body['clubPlayers'])
+    # Solves don't write allPlayers.csv, it follows the uploaded club
+    artifacts.save_club(cached.frame)
+    return cached.to_dict()
+
+@app.put('/roster/{roster_id}')
+async def put_roster(roster_id: str, request: Request):
+    body = await request.json()
+    return await run_in_threadpool(put_roster_handler)(roster_id, body)
+
+def patch_roster_handler(roster_id, body):
+    try:
+        cached = roster.apply_delta(
+            roster_id,
+            body['baseVersion'],
+            body['version'],
+            body.get('added', []),
+            body.get('changed', []),
+            body.get('removed', []),
+        )
+    except roster.RosterError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    artifacts.save_club(cached.frame)
+    return cached.to_dict()
+
+@app.patch('/roster/{roster_id}')
+async def patch_roster(roster_id: str, request: Request):
+    body = await request.json()
+    return await run_in_threadpool(patch_roster_handler)(roster_id, body)
+
+@app.get('/roster/{roster_id}')
+async def get_roster(roster_id: str):
+    try:
+        return roster.get(roster_id).to_dict()
+    except roster.RosterError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 # Add endpoint to clear logs in a separate thread
 def clear_logs_handler():
     logger.clear_logs()
@@ -141,7 +292,8 @@ async def get_all_players_csv():
     import os
     from fastapi.responses import FileResponse
 
-    csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'allPlayers.csv')
+    # Club players of the latest roster upload
+    csv_path = artifacts.CLUB_CSV
 
     if os.path.exists(csv_path):
         logging.info(f"Serving CSV file from: {csv_path}")
@@ -235,6 +387,8 @@ def start():
     logging.info("Server stopped")
 
 if __name__ == "__main__":
+    # Needed for the solver processes in the packaged executable
+    multiprocessing.freeze_support()
     try:
         start()
     except KeyboardInterrupt:
@@ -245,5 +399,6 @@ if __name__ == "__main__":
         # Ensure thread pool is always shut down
         if thread_pool:
             thread_pool.shutdown(wait=False)
+        job_pool.shutdown(wait=False, cancel_futures=True)
         logging.info("Application terminated")
     sys.exit(0)
@@ -1,9 +1,16 @@
 import json
-from threading import Timer
+import os
+import threading
 import time
+import numpy as np
+import pandas as pd
 from ortools.sat.python import cp_model
 from decimal import Decimal
-from .logger import add_log  # Import the add_log function from globals
+from fractions import Fraction
+import math
+from .logger import add_log, current_stream_id  # Import the add_log function from globals
+from . import warm_start
+from .cache import LRUCache
 
 
 def runtime(func):
@@ -20,21 +27,96 @@ def runtime(func):
     return wrapper
 
 
+# Default seconds without a better squad before the search stops, overridden by earlyStop in the /solve payload
+STAGNATION_SECONDS = float(os.environ.get("AUTOSBC_STAGNATION_SECONDS", 30))
+# earlyStop payload keys and the StopPolicy settings they set
+EARLY_STOP_KEYS = {
+    "stagnationSeconds": "stagnation_seconds",
+    "relativeGap": "relative_gap",
+    "absoluteGap": "absolute_gap",
+    "targetCost": "target_cost",
+}
+
+
+class StopPolicy:
+    """When to stop the search before the time limit, every setting is off when None.
+
+    stagnation_seconds: no better squad was found for this long
+    relative_gap, absolute_gap: the best squad is this close to the objective bound
+    target_cost: a squad costing at most this much was found
+    """
+
+    def __init__(self, stagnation_seconds=STAGNATION_SECONDS, relative_gap=None, absolute_gap=None, target_cost=None):
+        self.stagnation_seconds = stagnation_seconds
+        self.relative_gap = relative_gap
+        self.absolute_gap = absolute_gap
+        self.target_cost = target_cost
+
+    @classmethod
+    def from_request(cls, early_stop):
+        """Policy from the earlyStop object of a /solve payload, ignoring invalid settings"""
+        policy = cls()
+        for key, value in (early_stop or {}).items():
+            if key not in EARLY_STOP_KEYS:
+                add_log(f"Unknown early stop setting {key}, ignoring it")
+                continue
+            try:
+                value = float(value) if value is not None else None
+            except (TypeError, ValueError):
+                add_log(f"Invalid early stop setting {key}: {value}, ignoring it")
+                continue
+            if value is not None and value < 0:
+                add_log(f"Invalid early stop setting {key}: {value}, ignoring it")
+                continue
+            setattr(policy, EARLY_STOP_KEYS[key], value)
+        return policy
+
+    def apply(self, parameters):
+        """Let CP-SAT stop by itself once the gap to the objective bound is small enough"""
+        # The status is OPTIMAL when a gap limit stops the search
+        if self.relative_gap is not None:
+            parameters.relative_gap_limit = self.relative_gap
+        if self.absolute_gap is not None:
+            parameters.absolute_gap_limit = self.absolute_gap
+
+    def __str__(self):
+        return ", ".join(
+            f"{key} {getattr(self, setting)}" for key, setting in EARLY_STOP_KEYS.items()
+        )
+
+
 class SolutionCallback(cp_model.CpSolverSolutionCallback):
-    """Stop the search if the objective remains the same for X seconds"""
+    """Record every better squad and stop the search as the StopPolicy says"""
 
-    def __init__(self, timer_limit: int, player):
+    def __init__(self, policy, player, pos=None, chem_expr=None, describe_squad=None):
         super().__init__()
-        self._timer_limit = timer_limit
-        self._timer = None
+        self._policy = policy
         self._player = player
+        self._pos = pos
+        self._chem_expr = chem_expr
+        # describe_squad(rows, chemistry) decodes a squad for the squad events,
+        # on a thread of its own so the search doesn't wait for it
+        self._describe_squad = describe_squad
+        self._decoder = None
+        self._pending_squad = None
+        self._squad_ready = threading.Condition()
+        # Called from CP-SAT threads, so remember the stream of the solve
+        self._log_stream = current_stream_id()
         self.solutions = []  # Add this to store solutions
         self.solution_count = 0
+        self.first_solution_at = None
+        self._last_improvement_at = None
+        # One watchdog per solve checks for stagnation, set once the search is over
+        self._watchdog = None
+        self._finished = threading.Event()
 
     def on_solution_callback(self):
         """This is called everytime a solution with better objective is found."""
         self.solution_count += 1
         objective_value = self.ObjectiveValue()
+        self._last_improvement_at = time.time()
+        if self.first_solution_at is None:
+            self.first_solution_at = self._last_improvement_at
         
         # Store solution details
         solution_info = {
@@ -50,26 +132,137 @@ class SolutionCallback(cp_model.CpSolverSolutionCallback):
                 selected_players.append(i)
         solution_info["selected_players"] = selected_players
         print("selected_players", selected_players)
+        event = {
+            "type": "solution",
+            "solution_number": self.solution_count,
+            "objective_value": objective_value,
+            "elapsed": self.WallTime(),
+        }
         # Use the shared logging function
         add_log(f"Solution {self.solution_count} found with objective value: {objective_value}",
-                selected_players)
+                selected_players, stream_id=self._log_stream, event=event)
+        if self._describe_squad is not None:
+            self._queue_squad(selected_players, self._squad_chemistry(selected_players))
         self.solutions.append(solution_info)
-        self._reset_timer()
-        
 
-    def _reset_timer(self):
-        if self._timer:
-            self._timer.cancel()
-        self._timer = Timer(self._timer_limit, self.StopSearch)
-        self._timer.start()
+        if self._policy.target_cost is not None and objective_value <= self._policy.target_cost:
+            add_log(f"Squad costs at most the target {self._policy.target_cost}, stopping the search",
+                    stream_id=self._log_stream)
+            self.StopSearch()
+        elif self._policy.stagnation_seconds and self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch_stagnation, daemon=True)
+            self._watchdog.start()
+
+    def _squad_chemistry(self, rows):
+        """(Is_Pos, Chemistry) of each row of the current solution"""
+        chemistry = {}
+        for i in rows:
+            if self._pos is not None and self.Value(self._pos[i]) == 1:
+                chemistry[i] = (1, min(3, self.Value(self._chem_expr[i])))
+            else:
+                chemistry[i] = (0, 0)
+        return chemistry
+
+    def _queue_squad(self, rows, chemistry):
+        """Hand the squad of this solution to the decoder, which only decodes the latest one"""
+        with self._squad_ready:
+            self._pending_squad = (self.solution_count, rows, chemistry)
+            self._squad_ready.notify()
+        if self._decoder is None:
+            self._decoder = threading.Thread(target=self._decode_squads, daemon=True)
+            self._decoder.start()
+
+    def _decode_squads(self):
+        """Log a squad event for the latest solution until the search is over"""
+        while True:
+            with self._squad_ready:
+                while self._pending_squad is None and not self._finished.is_set():
+                    self._squad_ready.wait()
+                if self._pending_squad is None:
+                    return
+                solution_number, rows, chemistry = self._pending_squad
+                self._pending_squad = None
+            event = {
+                "type": "squad",
+                "solution_number": solution_number,
+                "squad": self._describe_squad(rows, chemistry),
+            }
+            add_log(f"Squad of solution {solution_number} decoded", rows,
+                    stream_id=self._log_stream, event=event)
+
+    def _watch_stagnation(self):
+        """Stop the search once no better squad was found for stagnation_seconds"""
+        while True:
+            remaining = self._last_improvement_at + self._policy.stagnation_seconds - time.time()
+            if remaining <= 0:
+                print(f"{self._policy.stagnation_seconds} seconds without improvement in objective. ")
+                add_log(f"{self._policy.stagnation_seconds} seconds without a better squad, stopping the search",
+                        stream_id=self._log_stream)
+                self.StopSearch()
+                return
+            if self._finished.wait(remaining):
+                return
+
+    def finish(self):
+        """Stop the stagnation watchdog after the search, and wait for the last squad event"""
+        with self._squad_ready:
+            self._finished.set()
+            self._squad_ready.notify()
+        if self._decoder is not None:
+            self._decoder.join()
+
 
-    def StopSearch(self):
-        print(f"{self._timer_limit} seconds without improvement in objective. ")
-        super().StopSearch()
+@runtime
+def group_players(player, codes):
+    """Group the player variables by the index of each field value.
+
+    codes[field][i] is the map_idx index of row i, so a stable argsort of the
+    codes gives every group as one contiguous slice of row indices.
+    """
+    players_grouped = {}
+    for field, field_codes in codes.items():
+        order = np.argsort(field_codes, kind="stable")
+        sorted_codes = field_codes[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(order)]))
+        players_grouped[field] = {
+            int(sorted_codes[start]): [player[i] for i in order[start:end]]
+            for start, end in zip(starts, ends)
+        }
+    return players_grouped
+
+
+def get_hint_rows(df, sbc):
+    """Rows to hint from the current solution, and the assetIds in it.
+
+    Each assetId in the current solution hints the row placed at its
+    solution position, or its first row if it has no row for that position.
+    """
+    solution_positions = {}
+    for idx, assetId in enumerate(sbc["currentSolution"]):
+        if assetId is not None:
+            solution_positions.setdefault(assetId, sbc["formation"][idx])
+    if not solution_positions:
+        return set(), solution_positions
+
+    # assetId -> first row and (assetId, position) -> first row, built once
+    asset_rows = {}
+    asset_pos_rows = {}
+    for i, key in enumerate(zip(df["assetId"], df["possiblePositions"])):
+        asset_rows.setdefault(key[0], i)
+        asset_pos_rows.setdefault(key, i)
+
+    hint_rows = set()
+    for assetId, position in solution_positions.items():
+        row = asset_pos_rows.get((assetId, position), asset_rows.get(assetId))
+        if row is not None:
+            hint_rows.add(row)
+    return hint_rows, solution_positions
 
 
 @runtime
-def create_var(model, df, map_idx, num_cnts, sbc):
+def create_var(model, df, map_idx, num_cnts, sbc, codes):
     """Create the relevant variables"""
     num_players, num_teamIds, num_leagueId, num_nationId, num_ratingTier = (
         num_cnts[0],
@@ -82,87 +275,14 @@ def create_var(model, df, map_idx, num_cnts, sbc):
     player = []  # player[i] = 1 => i^th player is considered and 0 otherwise
     chem = []  # chem[i] = chemistry of i^th player
 
-    # Preprocessing things to speed-up model creation time.
-    # Thanks Gregory Wullimann !!
-    players_grouped = {
-        "teamId": {},
-        "leagueId": {},
-        "nationId": {},
-        "possiblePositions": {},
-        "rating": {},
-        "ratingTier": {},
-        "groups": {},
-        "rarityId": {},
-        "name": {},
-    }
-    # Try adding hints to solver to enable rerun of solver multiple times and start where you left off
-    playerHints = []
     for i in range(num_players):
         boolVar = model.NewBoolVar(f"player{i}")
         player.append(boolVar)
-        if sum(1 for _ in filter(None.__ne__, sbc["currentSolution"])) > 0:
-            if df.at[i, "assetId"] in sbc["currentSolution"]:
-                solutionPosition = sbc["formation"][
-                    sbc["currentSolution"].index(df.at[i, "assetId"])
-                ]
-                key_names = ["assetId", "possiblePositions"]
-                keys = [df.at[i, "assetId"], solutionPosition]
-
-                if (
-                    df.at[i, "possiblePositions"] == solutionPosition
-                    or df[(df[key_names] == keys).all(1)]["name"].count() == 0
-                ) and df.at[i, "assetId"] not in playerHints:
-                    playerHints.append(df.at[i, "assetId"])
-                    model.AddHint(boolVar, 1)
-            else:
-                model.AddHint(boolVar, 0)
         chem.append(model.NewIntVar(0, 3, f"chem{i}"))
-        players_grouped["teamId"][map_idx["teamId"][df.at[i, "teamId"]]] = (
-            players_grouped["teamId"].get(map_idx["teamId"][df.at[i, "teamId"]], [])
-            + [player[i]]
-        )
-        players_grouped["leagueId"][map_idx["leagueId"][df.at[i, "leagueId"]]] = (
-            players_grouped["leagueId"].get(
-                map_idx["leagueId"][df.at[i, "leagueId"]], []
-            )
-            + [player[i]]
-        )
-        players_grouped["nationId"][map_idx["nationId"][df.at[i, "nationId"]]] = (
-            players_grouped["nationId"].get(
-                map_idx["nationId"][df.at[i, "nationId"]], []
-            )
-            + [player[i]]
-        )
-        players_grouped["possiblePositions"][
-            map_idx["possiblePositions"][df.at[i, "possiblePositions"]]
-        ] = players_grouped["possiblePositions"].get(
-            map_idx["possiblePositions"][df.at[i, "possiblePositions"]], []
-        ) + [
-            player[i]
-        ]
-        players_grouped["rating"][map_idx["rating"][df.at[i, "rating"]]] = (
-            players_grouped["rating"].get(map_idx["rating"][df.at[i, "rating"]], [])
-            + [player[i]]
-        )
-        players_grouped["ratingTier"][map_idx["ratingTier"][df.at[i, "ratingTier"]]] = (
-            players_grouped["ratingTier"].get(
-                map_idx["ratingTier"][df.at[i, "ratingTier"]], []
-            )
-            + [player[i]]
-        )
-        players_grouped["groups"][map_idx["groups"][df.at[i, "groups"]]] = (
-            players_grouped["groups"].get(map_idx["groups"][df.at[i, "groups"]], [])
-            + [player[i]]
-        )
-        players_grouped["rarityId"][map_idx["rarityId"][df.at[i, "rarityId"]]] = (
-            players_grouped["rarityId"].get(
-                map_idx["rarityId"][df.at[i, "rarityId"]], []
-            )
-            + [player[i]]
-        )
-        players_grouped["name"][map_idx["name"][df.at[i, "name"]]] = players_grouped[
-            "name"
-        ].get(map_idx["name"][df.at[i, "name"]], []) + [player[i]]
+
+    # Preprocessing things to speed-up model creation time.
+    # Thanks Gregory Wullimann !!
+    players_grouped = group_players(player, codes)
     # These variables are basically chemistry of each teamId, leagueId and nation
     z_teamId = [model.NewIntVar(0, 3, f"z_teamId{i}") for i in range(num_teamIds)]
     z_leagueId = [model.NewIntVar(0, 3, f"z_leagueId{i}") for i in range(num_leagueId)]
@@ -201,6 +321,22 @@ def create_var(model, df, map_idx, num_cnts, sbc):
     )
 
 
+def add_hints(model, df, sbc, player, warm_rows=None):
+    """Hint the current solution, or else the warm start squad"""
+    # Try adding hints to solver to enable rerun of solver multiple times and start where you left off
+    hint_rows, solution_assets = get_hint_rows(df, sbc)
+    asset_ids = df["assetId"].tolist()
+    for i, boolVar in enumerate(player):
+        if solution_assets:
+            if i in hint_rows:
+                model.AddHint(boolVar, 1)
+            elif asset_ids[i] not in solution_assets:
+                model.AddHint(boolVar, 0)
+        elif warm_rows:
+            model.AddHint(boolVar, 1 if i in warm_rows else 0)
+    return model
+
+
 @runtime
 def create_basic_constraints(
     df, model, player, map_idx, players_grouped, num_cnts, NUM_PLAYERS
@@ -385,13 +521,14 @@ def create_squad_rating_constraint_3(
     round_expr = int(precision / 2)
     squad_rating = int(squad_rating * precision)
 
-    df["int_rating"] = (df["rating"] * precision).astype(int)
-    df["avg_rating"] = ((df["rating"] / 11) * precision).astype(int)
+    # Local arrays, df can be the candidates frame held in the preprocess cache
+    int_rating = (df["rating"] * precision).astype(int).tolist()
+    avg_rating = ((df["rating"] / 11) * precision).astype(int).tolist()
     total_var = model.NewIntVar(0, 99 * precision, "total_rating")
-    total_rating = cp_model.LinearExpr.WeightedSum(player, df["int_rating"].tolist())
+    total_rating = cp_model.LinearExpr.WeightedSum(player, int_rating)
     # model.Add(total_rating == total_var)
     avg_var = model.NewIntVar(0, 99 * precision, "average_rating")
-    average_rating = cp_model.LinearExpr.WeightedSum(player, df["avg_rating"].tolist())
+    average_rating = cp_model.LinearExpr.WeightedSum(player, avg_rating)
     model.Add(average_rating == avg_var)
 
     rating_list = df["rating"].unique().tolist()
@@ -434,17 +571,75 @@ def create_squad_rating_constraint_3(
     return model, final_rating, average_rating, sum_excess
 
 
+@runtime
+def create_squad_rating_constraint_total(
+    df,
+    model,
+    player,
+    map_idx,
+    players_grouped,
+    num_cnts,
+    num_players,
+    squad_rating,
+    scope,
+):
+    """Squad rating: Min XX (>=), enumerating the total of the ratings.
+
+    Once the total S is fixed the average S / 11 is a constant, so the excess
+    of each rating over it is linear in the number of players with that
+    rating. One Boolean per achievable S replaces the per-rating
+    multiplications. Ratings are counted in 11ths to stay integral.
+    Returns the total of the ratings, with no average variable.
+    """
+    ratings = []
+    rating_count = []  # rating_count[k] = number of selected players with ratings[k]
+    for rating, rating_idx in map_idx["rating"].items():
+        ratings.append(int(rating))
+        rating_count.append(
+            cp_model.LinearExpr.Sum(players_grouped["rating"].get(rating_idx, []))
+        )
+    total_rating = cp_model.LinearExpr.WeightedSum(rating_count, ratings)
+    sum_excess = model.NewIntVar(0, 11 * 99 * num_players, "sum_excess")
+    final_rating = 11 * total_rating + sum_excess
+
+    # The squad rating rounds up from half a point below the target
+    target = Fraction(str(squad_rating)) * num_players * 11 - Fraction(11, 2)
+    if scope == "LOWER":
+        model.Add(final_rating <= math.floor(target))
+    else:
+        model.Add(final_rating >= math.ceil(target))
+
+    totals = []
+    total_vars = []
+    for total in range(num_players * min(ratings), num_players * max(ratings) + 1):
+        most_excess = num_players * max(0, 11 * max(ratings) - total)
+        if scope != "LOWER" and 11 * total + most_excess < target:
+            continue
+        if scope == "LOWER" and 11 * total > target:
+            continue
+        total_var = model.NewBoolVar(f"total_rating_{total}")
+        excess = [max(0, 11 * rating - total) for rating in ratings]
+        model.Add(
+            sum_excess == cp_model.LinearExpr.WeightedSum(rating_count, excess)
+        ).OnlyEnforceIf(total_var)
+        totals.append(total)
+        total_vars.append(total_var)
+    model.AddExactlyOne(total_vars)
+    model.Add(total_rating == cp_model.LinearExpr.WeightedSum(total_vars, totals))
+    return model, total_rating, None, sum_excess
+
+
 @runtime
 def create_squad_rating_constraint(
     df, model, player, map_idx, players_grouped, num_cnts, num_players, squad_rating
 ):
     """Squad rating: Min XX (>=)"""
     ratings = df["rating"].tolist()
-    df["avgratings"] = df["rating"] / num_players
+    avgratings = (df["rating"] / num_players).tolist()
 
     total_rating_expr = cp_model.LinearExpr.WeightedSum(player, ratings)
 
-    average_rating = cp_model.LinearExpr.WeightedSum(player, df["avgratings"].tolist())
+    average_rating = cp_model.LinearExpr.WeightedSum(player, avgratings)
     # excess  (each player's rating - total avg rating)
 
     excess = [model.NewIntVar(0, 99, f"excess{i}") for i in range(len(ratings))]
@@ -689,7 +884,13 @@ def create_chemistry_constraint(
     CHEM_PER_PLAYER,
     NUM_PLAYERS,
 ):
-    """Optimize Chemistry (>=) - Position-based constraint creation"""
+    """Optimize Chemistry (>=) - Position-based constraint creation.
+
+    pos[i] = 1 => i^th player is selected and placed in their possiblePositions,
+    so it is the only indicator per player and no Boolean products are needed.
+    The chemistry requirements are lower bounds, so chem[i] only needs to be
+    bounded above by the team, league and nation tiers of its player.
+    """
     # Log function start
     add_log(f"Creating chemistry constraint with target: {CHEMISTRY}, min per player: {CHEM_PER_PLAYER}")
     
@@ -699,7 +900,6 @@ def create_chemistry_constraint(
     teamId_dict = map_idx["teamId"]
     leagueId_dict = map_idx["leagueId"]
     nationId_dict = map_idx["nationId"]
-    pos_dict = map_idx["possiblePositions"]
     
     # Chemistry bucket definitions
     teamId_bucket = [[0, 1], [2, 3], [4, 6], [7, NUM_PLAYERS]]
@@ -721,85 +921,66 @@ def create_chemistry_constraint(
     # Setup position variables and chemistry calculations only for selected players
     add_log("Setting up position variables and chemistry calculations")
     
-    # Track selected players by team, league, and nation
-    team_players = {i: [] for i in range(num_cnts[1])}  # team_players[team_idx] = list of selected players
+    # Track players in position by team, league, nation and formation position
+    team_players = {i: [] for i in range(num_cnts[1])}
     league_players = {i: [] for i in range(num_cnts[2])}
     nation_players = {i: [] for i in range(num_cnts[3])}
+    position_players = {position: [] for position in formation_positions}
+    
+    positions = df["possiblePositions"].tolist()
+    teamIds = df["teamId"].tolist()
+    leagueIds = df["leagueId"].tolist()
+    nationIds = df["nationId"].tolist()
     
     # For each player, create variables
     for i in range(num_players):
         pos_var = model.NewBoolVar(f"pos_{i}")
         pos.append(pos_var)
-        chem_expr.append(model.NewIntVar(0, 3, f"chem_expr_{i}"))
         
-        p_pos = df.at[i, "possiblePositions"]
+        p_pos = positions[i]
         
         # Player can only have position if they are in the correct position in formation
         if p_pos in formation_positions:
-            # Create a variable that is 1 if player is selected AND in position
-            player_in_pos = model.NewBoolVar(f"player_in_pos_{i}")
-            model.AddMultiplicationEquality(player_in_pos, player[i], pos[i])
-            
-            # Calculate chemistry for this player if selected
-            p_teamId = df.at[i, "teamId"]
-            p_leagueId = df.at[i, "leagueId"]
-            p_nation = df.at[i, "nationId"]
+            # In position implies selected
+            model.AddImplication(pos_var, player[i])
             
-            team_idx = teamId_dict[p_teamId]
-            league_idx = leagueId_dict[p_leagueId]
-            nation_idx = nationId_dict[p_nation]
+            team_idx = teamId_dict[teamIds[i]]
+            league_idx = leagueId_dict[leagueIds[i]]
+            nation_idx = nationId_dict[nationIds[i]]
             
-            # Track this player for team, league, and nation counts
-            team_players[team_idx].append(player_in_pos)
-            league_players[league_idx].append(player_in_pos)
-            nation_players[nation_idx].append(player_in_pos)
+            # Track this player for team, league, nation and position counts
+            team_players[team_idx].append(pos_var)
+            league_players[league_idx].append(pos_var)
+            nation_players[nation_idx].append(pos_var)
+            position_players[p_pos].append(pos_var)
             
-            # Chemistry calculation for selected players in position
+            # Chemistry of a player in position, capped at 3 by the domain of chem[i]
             sum_expr = (
                 z_teamId[team_idx]
                 + z_leagueId[league_idx]
                 + z_nation[nation_idx]
             )
-            
-            # Cap chemistry at 3
-            b = model.NewBoolVar(f"b_chem_{i}")
-            model.Add(sum_expr <= 3).OnlyEnforceIf([b, player_in_pos])
-            model.Add(sum_expr > 3).OnlyEnforceIf([b.Not(), player_in_pos])
-            model.Add(chem[i] == sum_expr).OnlyEnforceIf([b, player_in_pos])
-            model.Add(chem[i] == 3).OnlyEnforceIf([b.Not(), player_in_pos])
+            model.Add(chem[i] <= sum_expr).OnlyEnforceIf(pos_var)
+            chem_expr.append(sum_expr)
             
             # If player not selected or not in position, chemistry is 0
-            model.Add(chem[i] == 0).OnlyEnforceIf(player_in_pos.Not())
+            model.Add(chem[i] == 0).OnlyEnforceIf(pos_var.Not())
         else:
             # Player not in formation position, cannot contribute chemistry
-            model.Add(pos[i] == 0)
+            model.Add(pos_var == 0)
             model.Add(chem[i] == 0)
+            chem_expr.append(0)
     
     # Enforce position counts from the formation
-    for position in formation_positions:
-        if position not in pos_dict:
-            continue
-            
-        position_idx = pos_dict[position]
-        count_needed = position_counts[position]
-        position_expr = []
-        
-        # Get all players eligible for this position who are selected
-        for i in range(num_players):
-            if df.at[i, "possiblePositions"] == position:
-                # Create a variable that is 1 if player is selected AND in position
-                player_in_pos = model.NewBoolVar(f"player_in_pos_{position}_{i}")
-                model.AddMultiplicationEquality(player_in_pos, player[i], pos[i])
-                position_expr.append(player_in_pos)
-        
-        # Enforce the count constraint
-        model.Add(sum(position_expr) <= count_needed)
+    for position, position_expr in position_players.items():
+        if position_expr:
+            model.Add(cp_model.LinearExpr.Sum(position_expr) <= position_counts[position])
     
     add_log("Setting up team chemistry tiers")
     # Apply team chemistry tiers
     for team_idx, team_players_list in team_players.items():
         if team_players_list:
-            team_sum = sum(team_players_list)
+            team_sum = cp_model.LinearExpr.Sum(team_players_list)
             for idx, (lb, ub) in enumerate(teamId_bucket):
                 model.AddLinearConstraint(team_sum, lb, ub).OnlyEnforceIf(b_c[team_idx][idx])
                 model.Add(z_teamId[team_idx] == idx).OnlyEnforceIf(b_c[team_idx][idx])
@@ -809,7 +990,7 @@ def create_chemistry_constraint(
     # Apply league chemistry tiers
     for league_idx, league_players_list in league_players.items():
         if league_players_list:
-            league_sum = sum(league_players_list)
+            league_sum = cp_model.LinearExpr.Sum(league_players_list)
             for idx, (lb, ub) in enumerate(leagueId_bucket):
                 model.AddLinearConstraint(league_sum, lb, ub).OnlyEnforceIf(b_l[league_idx][idx])
                 model.Add(z_leagueId[league_idx] == idx).OnlyEnforceIf(b_l[league_idx][idx])
@@ -819,28 +1000,22 @@ def create_chemistry_constraint(
     # Apply nation chemistry tiers
     for nation_idx, nation_players_list in nation_players.items():
         if nation_players_list:
-            nation_sum = sum(nation_players_list)
+            nation_sum = cp_model.LinearExpr.Sum(nation_players_list)
             for idx, (lb, ub) in enumerate(nationId_bucket):
                 model.AddLinearConstraint(nation_sum, lb, ub).OnlyEnforceIf(b_n[nation_idx][idx])
                 model.Add(z_nation[nation_idx] == idx).OnlyEnforceIf(b_n[nation_idx][idx])
             model.AddExactlyOne(b_n[nation_idx])
     
-    # Total chemistry requirement
+    # Total chemistry requirement, chem[i] is already 0 for players not selected
     if CHEMISTRY > 0:
-        total_chemistry = []
-        for i in range(num_players):
-            player_chem = model.NewIntVar(0, 3, f"player_chem_{i}")
-            model.AddMultiplicationEquality(player_chem, player[i], chem[i])
-            total_chemistry.append(player_chem)
-        
-        model.Add(cp_model.LinearExpr.Sum(total_chemistry) >= CHEMISTRY)
+        model.Add(cp_model.LinearExpr.Sum(chem) >= CHEMISTRY)
         add_log(f"Added constraint for total chemistry >= {CHEMISTRY}")
     
     # Per-player chemistry requirement
     if CHEM_PER_PLAYER > 0:
         for i in range(num_players):
             model.Add(chem[i] >= CHEM_PER_PLAYER).OnlyEnforceIf(player[i])
-            add_log(f"Each selected player must have chemistry >= {CHEM_PER_PLAYER}")
+        add_log(f"Each selected player must have chemistry >= {CHEM_PER_PLAYER}")
     
     return model, pos, chem_expr
 
@@ -1001,6 +1176,10 @@ def create_unique_nationId_constraint(
     return model
 
 
+# Squad rating encoding, "excess" (create_squad_rating_constraint_3) or
+# "total" (create_squad_rating_constraint_total)
+RATING_ENCODING = os.environ.get("AUTOSBC_RATING_ENCODING", "excess")
+
 MINIMIZE_MAX_COST = False
 MAXIMIZE_TOTAL_COST = False
 
@@ -1026,25 +1205,187 @@ def set_objective(df, model, player):
     return model
 
 
+# Default solver profile, overridden by solverProfile in the /solve payload
+SOLVER_PROFILE = os.environ.get("AUTOSBC_SOLVER_PROFILE", "auto")
+
+
+def solver_profile_parameters(profile, cores, num_rows, chemistry):
+    """CP-SAT parameters for a solver profile.
+
+    auto: up to 8 workers for small models without chemistry, up to 16 otherwise
+    light: up to 4 workers, leaves the machine usable while solving
+    max: every available core
+    legacy: the 24 workers used before profiles existed
+
+    cores is the worker budget of the solve, no profile uses more.
+    """
+    profile = profile or SOLVER_PROFILE
+    cores = cores or os.cpu_count() or 1
+    if profile == "light":
+        workers = min(cores, 4)
+    elif profile == "max":
+        workers = cores
+    elif profile == "legacy":
+        workers = min(cores, 24)
+    else:
+        if profile != "auto":
+            add_log(f"Unknown solver profile {profile}, using auto")
+        # Small models gain little from extra workers, chemistry gains from more LNS
+        if chemistry or num_rows >= 1000:
+            workers = min(cores, 16)
+        else:
+            workers = min(cores, 8)
+    return {"num_search_workers": max(1, workers)}
+
+
+def create_solver(maxSolveTime, num_workers, solver_profile, num_rows, chemistry, early_stop=None):
+    """CP-SAT solver set up for a solve, with its StopPolicy"""
+    solver = cp_model.CpSolver()
+
+    """Solver Parameters"""
+    # solver.parameters.random_seed = 42
+    # Whether the solver should log the search progress.
+    solver.parameters.max_time_in_seconds = maxSolveTime
+    solver.parameters.log_search_progress = True
+    # Specify the number of parallel workers (i.e. threads) to use during search.
+    # This should usually be lower than your number of available cpus + hyperthread in your machine.
+    # The profile picks them from the cores available, the model size and chemistry.
+    parameters = solver_profile_parameters(
+        solver_profile, num_workers, num_rows, chemistry
+    )
+    for name, value in parameters.items():
+        setattr(solver.parameters, name, value)
+    add_log(f"Solver profile {solver_profile or SOLVER_PROFILE}: {parameters}")
+    # Stop the search when the gap between the best feasible objective (O) and
+    # our best objective bound (B) is smaller than a limit.
+    # Relative: abs(O - B) / max(1, abs(O)).
+    # Note that if the gap is reached, the search status will be OPTIMAL. But
+    # one can check the best objective bound to see the actual gap.
+    policy = StopPolicy.from_request(early_stop)
+    policy.apply(solver.parameters)
+    add_log(f"Early stop: {policy}")
+    # solver.parameters.cp_model_presolve = False
+    # solver.parameters.stop_after_first_solution = True
+    return solver, policy
+
+
 def get_dict(df, col):
-    """Map fields to a unique index"""
+    """Map fields to a unique index, along with the index of every row"""
+    codes, unique_col = pd.factorize(df[col], use_na_sentinel=False)
     d = {}
-    unique_col = df[col].unique()
     for i, val in enumerate(unique_col):
         d[val] = i
-    return d
+    return d, codes
+
+
+# Built models of recent SBCs, reused by re-solves on the same rows
+model_cache = LRUCache(int(os.environ.get("AUTOSBC_MODEL_CACHE_SIZE", 4)))
+# Columns a row's variables and constraints depend on, the price only enters the objective
+MODEL_COLUMNS = [
+    "id",
+    "name",
+    "cardType",
+    "teamId",
+    "leagueId",
+    "nationId",
+    "possiblePositions",
+    "rating",
+    "ratingTier",
+    "groups",
+    "rarityId",
+]
+
+
+def row_keys(df):
+    """Key of every row made of its MODEL_COLUMNS values"""
+    return list(zip(*(df[column].tolist() for column in MODEL_COLUMNS if column in df)))
+
+
+class CompiledModel:
+    """A built model without hints or objective, with the variables of each of its rows"""
+
+    def __init__(self, df, model, player, pos, chem_expr, rating_vars):
+        self.model = model
+        self.player = player
+        self.pos = pos
+        self.chem_expr = chem_expr
+        self.rating_vars = rating_vars
+        self.row_index = {key: i for i, key in enumerate(row_keys(df))}
+
+    def rows_for(self, df):
+        """Model row of every row of df, None if df has a row the model lacks"""
+        rows = []
+        for key in row_keys(df):
+            row = self.row_index.get(key)
+            if row is None:
+                return None
+            rows.append(row)
+        # Rows repeated in df would share one variable
+        if len(set(rows)) < len(rows):
+            return None
+        return rows
+
+
+def model_signature(sbc, rating_encoding=None):
+    """The parts of an SBC the model depends on besides the players"""
+    return json.dumps(
+        [
+            sbc["constraints"],
+            sbc["formation"],
+            sbc["brickIndices"],
+            rating_encoding or RATING_ENCODING,
+        ],
+        sort_keys=True,
+        default=str,
+    )
 
 
 @runtime
-def SBC(df, sbc, maxSolveTime):
-    """Optimize SBC using Constraint Integer Programming"""
-    # Add global reference
-    global solver_logs
-    solver_logs = []  # Clear previous logs
-    
-    # Log start of solving
-    solver_logs.append({"time": time.time(), "message": "Starting SBC solver"})
-    
+def cached_model(df, sbc, rating_encoding=None, candidates=None):
+    """A copy of the SBC model ready for df, with the variables of its rows.
+
+    A model built earlier for the same SBC is reused when it has a row for
+    every row of df: the rows df no longer has (locked, sold or pruned
+    cards) are fixed to 0, and set_objective prices the rest from df.
+    Otherwise the model is built over candidates, a superset of df kept
+    so that later re-solves still fit it, and cached for the next solve.
+    """
+    key = model_signature(sbc, rating_encoding)
+    compiled = model_cache.get(key)
+    rows = compiled.rows_for(df) if compiled is not None else None
+    if rows is None and candidates is not None and len(candidates) > len(df):
+        compiled = build_model(candidates, sbc, rating_encoding)
+        rows = compiled.rows_for(df)
+        if rows is not None:
+            model_cache.put(key, compiled)
+            add_log(f"Built a new model over {len(candidates)} players: {model_cache.stats()}")
+    elif rows is not None:
+        add_log(f"Reusing the cached model ({len(compiled.player) - len(rows)} rows fixed out): {model_cache.stats()}")
+    if rows is None:
+        compiled = build_model(df, sbc, rating_encoding)
+        model_cache.put(key, compiled)
+        rows = list(range(len(df)))
+        add_log(f"Built a new model: {model_cache.stats()}")
+    model = compiled.model.Clone()
+    # Hints, constraints and the objective go on the copy's own variables
+    def clone_var(var):
+        return model.get_bool_var_from_proto_index(var.Index())
+    for row in set(range(len(compiled.player))) - set(rows):
+        model.Add(clone_var(compiled.player[row]) == 0)
+
+    player = [clone_var(compiled.player[row]) for row in rows]
+    pos = [clone_var(compiled.pos[row]) for row in rows] if compiled.pos is not None else None
+    chem_expr = [compiled.chem_expr[row] for row in rows] if compiled.chem_expr is not None else None
+    return model, player, pos, chem_expr, compiled.rating_vars
+
+
+@runtime
+def build_model(df, sbc, rating_encoding=None, model=None):
+    """Build the CP-SAT model of an SBC over the rows of df, without hints or objective.
+
+    The variables and constraints are added to model when one is given, so
+    several SBCs can share a model.
+    """
     num_cnts = [
         df.shape[0],
         df.teamId.nunique(),
@@ -1053,6 +1394,7 @@ def SBC(df, sbc, maxSolveTime):
         df.ratingTier.nunique(),
     ]  # Count of important fields
     map_idx = {}  # Map fields to a unique index
+    codes = {}  # codes[field][i] = map_idx[field] of the i^th player
     fields = [
         "teamId",
         "leagueId",
@@ -1065,10 +1407,11 @@ def SBC(df, sbc, maxSolveTime):
         "name",
     ]
     for field in fields:
-        map_idx[field] = get_dict(df, field)
+        map_idx[field], codes[field] = get_dict(df, field)
 
     """Create the CP-SAT Model"""
-    model = cp_model.CpModel()
+    if model is None:
+        model = cp_model.CpModel()
 
     """Create essential variables and do some pre-processing"""
 
@@ -1086,7 +1429,7 @@ def SBC(df, sbc, maxSolveTime):
         nationId,
         leagueId,
         players_grouped,
-    ) = create_var(model, df, map_idx, num_cnts, sbc)
+    ) = create_var(model, df, map_idx, num_cnts, sbc, codes)
 
     """Essential constraints"""
     NUM_PLAYERS = 11 - len(sbc["brickIndices"])
@@ -1097,6 +1440,8 @@ def SBC(df, sbc, maxSolveTime):
     """Comment out the constraints not required"""
     CHEMISTRY = 0
     CHEM_PER_PLAYER = 0
+    pos = chem_expr = None
+    total_rating = average_rating = sum_excess = None
 
     for req in sbc["constraints"]:
         print("Adding Constraint for ", req)
@@ -1312,8 +1657,13 @@ def SBC(df, sbc, maxSolveTime):
                 [req["eligibilityValues"][0]],
             )
         if req["requirementKey"] == "TEAM_RATING":
+            squad_rating_constraint = (
+                create_squad_rating_constraint_total
+                if (rating_encoding or RATING_ENCODING) == "total"
+                else create_squad_rating_constraint_3
+            )
             model, total_rating, average_rating, sum_excess = (
-                create_squad_rating_constraint_3(
+                squad_rating_constraint(
                     df,
                     model,
                     player,
@@ -1360,8 +1710,48 @@ def SBC(df, sbc, maxSolveTime):
         NUM_PLAYERS,
     )
 
-    """Fix specific players and optimize the rest"""
-    # model = fix_players(df, model, player, NUM_PLAYERS)
+    return CompiledModel(
+        df, model, player, pos, chem_expr, (total_rating, average_rating, sum_excess)
+    )
+
+
+def is_cancelled(job):
+    """Whether the job of a solve has been cancelled, solves without a job never are"""
+    return job is not None and job.cancelled()
+
+
+@runtime
+def SBC(df, sbc, maxSolveTime, job=None, num_workers=None, solver_profile=None, rating_encoding=None, early_stop=None, describe_squad=None, candidates=None):
+    """Optimize SBC using Constraint Integer Programming.
+
+    Returns the selected rows, the status text and code, and the seconds
+    until the first feasible squad was found (None if none was).
+    describe_squad(rows, chemistry) decodes the squads of the solution
+    events, chemistry maps each row to its (Is_Pos, Chemistry).
+    candidates are the players a newly built model is built over, see
+    cached_model.
+    """
+    solve_start = time.time()
+    # Log start of solving
+    add_log("Starting SBC solver")
+
+    """Without a current solution to hint, start the search from a heuristic squad"""
+    warm_squad = None
+    first_solution_at = None
+    if all(assetId is None for assetId in sbc["currentSolution"]) and not is_cancelled(job):
+        warm_squad = warm_start.greedy_squad(
+            df, sbc, warm_start.warm_start_seconds(maxSolveTime), describe_squad
+        )
+        if warm_squad:
+            first_solution_at = time.time()
+    warm_rows = set(warm_squad) if warm_squad else None
+
+    """Reuse the model of an earlier solve of this SBC when it has every row"""
+    model, player, pos, chem_expr, rating_vars = cached_model(df, sbc, rating_encoding, candidates)
+    total_rating, average_rating, sum_excess = rating_vars
+    model = add_hints(model, df, sbc, player, warm_rows)
+    # Only the chemistry model places players in position
+    chemistry = pos is not None
 
     """Set objective based on player cost"""
     model = set_objective(df, model, player)
@@ -1371,31 +1761,19 @@ def SBC(df, sbc, maxSolveTime):
 
     """Solve"""
     print("Solve Started")
-    solver_logs.append({"time": time.time(), "message": "Solve Started"})
+    add_log("Solve Started")
     
-    solver = cp_model.CpSolver()
-    
-    """Solver Parameters"""
-    # solver.parameters.random_seed = 42
-    # Whether the solver should log the search progress.
-    solver.parameters.max_time_in_seconds = maxSolveTime
-    solver.parameters.log_search_progress = True
-    # Specify the number of parallel workers (i.e. threads) to use during search.
-    # This should usually be lower than your number of available cpus + hyperthread in your machine.
-    # Setting this to 16 or 24 can help if the solver is slow in improving the bound.
-    solver.parameters.num_search_workers = 24
-    # Stop the search when the gap between the best feasible objective (O) and
-    # our best objective bound (B) is smaller than a limit.
-    # Relative: abs(O - B) / max(1, abs(O)).
-    # Note that if the gap is reached, the search status will be OPTIMAL. But
-    # one can check the best objective bound to see the actual gap.
-    # solver.parameters.relative_gap_limit = 0.05
-    # solver.parameters.cp_model_presolve = False
-    # solver.parameters.stop_after_first_solution = True
+    solver, policy = create_solver(
+        maxSolveTime, num_workers, solver_profile, len(df), chemistry, early_stop
+    )
     """Solver Parameters"""
      # Create callback instance
-    callback = SolutionCallback(timer_limit=30, player=player)
+    callback = SolutionCallback(policy, player, pos, chem_expr, describe_squad)
+    if job is not None and not job.attach_callback(callback):
+        # Cancelled before the search started, return without searching
+        solver.parameters.max_time_in_seconds = 0
     status = solver.Solve(model, callback)
+    callback.finish()
     
     print("\n")
     final_players = []
@@ -1405,23 +1783,128 @@ def SBC(df, sbc, maxSolveTime):
 
             if req["requirementKey"] == "TEAM_RATING":
                 print("Total Rating: ", solver.Value(total_rating))
-                print("Average Rating: ", solver.Value(average_rating))
+                if average_rating is not None:
+                    print("Average Rating: ", solver.Value(average_rating))
                 print("Excess: ", solver.Value(sum_excess))
         df["Chemistry"] = 0
         # Is_Pos = 1 => Player should be placed in their respective possiblePositions.
         df["Is_Pos"] = 0
-        for i in range(num_cnts[0]):
+        for i in range(len(df)):
 
             if solver.Value(player[i]) == 1 and df.loc[i, "cardType"] != "BRICK":
                 final_players.append(i)
                 try:
-                    df.loc[i, "Chemistry"] = solver.Value(chem_expr[i])
                     df.loc[i, "Is_Pos"] = solver.Value(pos[i])
+                    if df.loc[i, "Is_Pos"] == 1:
+                        df.loc[i, "Chemistry"] = min(3, solver.Value(chem_expr[i]))
                 except:
                     pass
-    return final_players, status_dict[status], status
+    elif warm_squad and status == 0 and is_cancelled(job):
+        add_log("Solve cancelled, not returning the warm start squad")
+    elif warm_squad and status == 0:
+        # Nothing better within the time limit, return the warm start squad
+        add_log("Solver found no squad in time, using the warm start squad")
+        status = 2
+        final_players = sorted(warm_squad)
+        df["Chemistry"] = 0
+        df["Is_Pos"] = 0
+        if chemistry:
+            for i, points in warm_start.SquadChecker(df, sbc).squad_chemistry(warm_squad).items():
+                df.loc[i, "Is_Pos"] = 1
+                df.loc[i, "Chemistry"] = points
+    if callback.first_solution_at is not None:
+        first_solution_at = min(first_solution_at or callback.first_solution_at, callback.first_solution_at)
+    first_solution_time = first_solution_at - solve_start if first_solution_at is not None else None
+    return final_players, status_dict[status], status, first_solution_time
+
 
 
+@runtime
+def SBC_batch(dfs, sbcs, maxSolveTime, job=None, num_workers=None, solver_profile=None, rating_encoding=None, early_stop=None):
+    """Optimize several SBCs in one model, minimizing their total cost with every card used at most once.
+
+    dfs[k] holds the preprocessed players of sbcs[k]. Returns the selected
+    rows of each SBC, the status text and code, and the seconds until the
+    first feasible set of squads was found (None if none was).
+    """
+    solve_start = time.time()
+    add_log(f"Starting joint solver for {len(sbcs)} SBCs")
+    model = cp_model.CpModel()
+    squads = [build_model(df, sbc, rating_encoding, model) for df, sbc in zip(dfs, sbcs)]
+
+    # A card can only be used by one of the SBCs
+    card_players = {}
+    for df, squad in zip(dfs, squads):
+        for card_id, boolVar in zip(df["id"].tolist(), squad.player):
+            card_players.setdefault(card_id, []).append(boolVar)
+    for players in card_players.values():
+        if len(players) > 1:
+            model.Add(cp_model.LinearExpr.Sum(players) <= 1)
+
+    # Hint warm start squads found one SBC after another, without reusing cards
+    used = set()
+    warm_squads = []
+    for df, sbc, squad in zip(dfs, sbcs, squads):
+        if is_cancelled(job):
+            warm_squads.append(None)
+            continue
+        unused = df[~df["id"].isin(used)]
+        warm_squad = warm_start.greedy_squad(
+            unused.reset_index(drop=True), sbc, warm_start.warm_start_seconds(maxSolveTime / len(sbcs))
+        )
+        warm_rows = sorted(int(row) for row in unused.index[warm_squad]) if warm_squad else None
+        warm_squads.append(warm_rows)
+        if warm_rows:
+            used.update(df.loc[warm_rows, "id"])
+            model = add_hints(model, df, sbc, squad.player, set(warm_rows))
+    first_solution_at = time.time() if all(warm_squads) else None
+
+    player = [boolVar for squad in squads for boolVar in squad.player]
+    prices = pd.concat([df[["price"]] for df in dfs], ignore_index=True)
+    model = set_objective(prices, model, player)
+
+    chemistry = any(squad.pos is not None for squad in squads)
+    solver, policy = create_solver(
+        maxSolveTime, num_workers, solver_profile, len(player), chemistry, early_stop
+    )
+    callback = SolutionCallback(policy, player)
+    if job is not None and not job.attach_callback(callback):
+        # Cancelled before the search started, return without searching
+        solver.parameters.max_time_in_seconds = 0
+    status = solver.Solve(model, callback)
+    callback.finish()
+
+    found = status == 2 or status == 4  # Feasible or Optimal
+    if status == 0 and first_solution_at is not None and is_cancelled(job):
+        add_log("Solve cancelled, not returning the warm start squads")
+    elif status == 0 and first_solution_at is not None:
+        # Nothing found within the time limit, return the warm start squads
+        add_log("Solver found no squads in time, using the warm start squads")
+        status = 2
+    final_players = []
+    for df, sbc, squad, warm_rows in zip(dfs, sbcs, squads, warm_squads):
+        rows = []
+        df["Chemistry"] = 0
+        df["Is_Pos"] = 0
+        if found:
+            for i, boolVar in enumerate(squad.player):
+                if solver.Value(boolVar) == 1 and df.loc[i, "cardType"] != "BRICK":
+                    rows.append(i)
+                    if squad.pos is not None and solver.Value(squad.pos[i]) == 1:
+                        df.loc[i, "Is_Pos"] = 1
+                        df.loc[i, "Chemistry"] = min(3, solver.Value(squad.chem_expr[i]))
+        elif status == 2:
+            rows = warm_rows
+            if squad.pos is not None:
+                for i, points in warm_start.SquadChecker(df, sbc).squad_chemistry(warm_rows).items():
+                    df.loc[i, "Is_Pos"] = 1
+                    df.loc[i, "Chemistry"] = points
+        final_players.append(rows)
+    if callback.first_solution_at is not None:
+        first_solution_at = min(first_solution_at or callback.first_solution_at, callback.first_solution_at)
+    first_solution_time = first_solution_at - solve_start if first_solution_at is not None else None
+    return final_players, status_dict[status], status, first_solution_time
+
 status_dict = {
     0: "UNKNOWN: The status of the model is still unknown. A search limit has been reached before any of the statuses below could be determined.",
     1: "MODEL_INVALID: The given CpModelProto didn't pass the validation step.",
@@ -0,0 +1,147 @@
+"""
+Candidate pruning for the Auto-SBC project
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .logger import add_log
+
+# Default pruning mode, overridden by pruning in the /solve payload
+PRUNING = os.environ.get("AUTOSBC_PRUNING", "aggressive")
+PRUNING_MODES = ["aggressive", "safe", "none"]
+
+# Player attributes each requirement depends on
+REQUIREMENT_COLUMNS = {
+    "CHEMISTRY_POINTS": ["teamId", "leagueId", "nationId", "possiblePositions"],
+    "ALL_PLAYERS_CHEMISTRY_POINTS": ["teamId", "leagueId", "nationId", "possiblePositions"],
+    "SAME_LEAGUE_COUNT": ["leagueId"],
+    "LEAGUE_COUNT": ["leagueId"],
+    "LEAGUE_ID": ["leagueId"],
+    "SAME_NATION_COUNT": ["nationId"],
+    "NATION_COUNT": ["nationId"],
+    "NATION_ID": ["nationId"],
+    "SAME_CLUB_COUNT": ["teamId"],
+    "CLUB_COUNT": ["teamId"],
+    "CLUB_ID": ["teamId"],
+    "PLAYER_RARITY_GROUP": ["groups"],
+    "PLAYER_RARITY": ["rarityId"],
+    "PLAYER_LEVEL": ["ratingTier"],
+}
+RATING_REQUIREMENTS = ["TEAM_RATING", "PLAYER_MIN_OVR", "PLAYER_MAX_OVR", "PLAYER_EXACT_OVR"]
+
+
+def pruning_mode(mode):
+    """Pruning mode of a solve.
+
+    aggressive: drop players over 50k and keep the 11 cheapest per grouping,
+        small models that can miss the cheapest squad
+    safe: only drop dominated players, the cheapest squad is always kept
+    none: model every player
+    """
+    mode = mode or PRUNING
+    if mode not in PRUNING_MODES:
+        add_log(f"Unknown pruning mode {mode}, using aggressive")
+        mode = "aggressive"
+    return mode
+
+
+# Integer key shared by the rows with the same values in all the columns
+def group_codes(df, columns):
+    key = np.zeros(len(df), dtype=np.int64)
+    for column in columns:
+        codes, uniques = pd.factorize(df[column], use_na_sentinel=False)
+        # Re-factorize after each column so the combined key stays small
+        key, _ = pd.factorize(key * len(uniques) + codes)
+    return key
+
+
+def rating_increases(req):
+    """Whether a higher rated player can only help to meet a rating requirement"""
+    if req["requirementKey"] == "TEAM_RATING":
+        return req.get("scope") != "LOWER"
+    if req["requirementKey"] == "PLAYER_MIN_OVR":
+        return req.get("scope") == "GREATER"
+    if req["requirementKey"] == "PLAYER_MAX_OVR":
+        return req.get("scope") == "LOWER"
+    return False
+
+
+def dominance_keys(sbc):
+    """Columns two rows must share for one to dominate the other, and how their ratings compare.
+
+    The rating comparison is None when no requirement looks at ratings,
+    "higher" when a higher rating never hurts and "equal" otherwise.
+    """
+    columns = set()
+    rating = None
+    for req in sbc["constraints"]:
+        columns.update(REQUIREMENT_COLUMNS.get(req["requirementKey"], []))
+        if req["requirementKey"] in RATING_REQUIREMENTS:
+            if rating_increases(req):
+                rating = rating or "higher"
+            else:
+                rating = "equal"
+    if rating == "equal":
+        columns.add("rating")
+    return sorted(columns), rating
+
+
+def dominated_rows(df, columns, rating, slots):
+    """Boolean mask of the rows that can be left out without losing the cheapest squad.
+
+    A row is dominated by an earlier row with the same values in columns, a
+    price at most as high and (when rating is "higher") a rating at least as
+    high. Once `slots` differently named players dominate a row, any squad
+    using it has one of them unused to swap in at no extra cost.
+    """
+    if len(df) == 0:
+        return np.zeros(0, dtype=bool)
+    bucket = group_codes(df, columns)
+    ratings = df["rating"].to_numpy(dtype=np.int64) if rating == "higher" else np.zeros(len(df), dtype=np.int64)
+    # Only buckets with more rows than slots can hold dominated rows
+    crowded = np.bincount(bucket)[bucket] > slots
+    order = np.lexsort((-ratings, df["price"].to_numpy(), bucket))
+    order = order[crowded[order]]
+
+    # Rows with fewer than `slots` rows before them in their bucket are always kept
+    position = pd.Series(bucket[order]).groupby(bucket[order]).cumcount().to_numpy()
+
+    names = df["name"].to_numpy()
+    dominated = np.zeros(len(df), dtype=bool)
+    current = None
+    for row, ahead in zip(order.tolist(), position.tolist()):
+        if bucket[row] != current:
+            current = bucket[row]
+            # Best rating kept so far for each name, and how many names reached each rating
+            best = {}
+            counts = [0] * (int(ratings.max()) + 2)
+        r = int(ratings[row])
+        name = names[row]
+        if ahead >= slots:
+            dominators = sum(counts[r:])
+            if best.get(name, -1) >= r:
+                dominators -= 1
+            if dominators >= slots:
+                dominated[row] = True
+                continue
+        previous = best.get(name)
+        if previous is None or r > previous:
+            if previous is not None:
+                counts[previous] -= 1
+            counts[r] += 1
+            best[name] = r
+    return dominated
+
+
+def prune_dominated(df, sbc, copies=1):
+    """Drop the rows dominated by enough other rows for copies squads of the SBC"""
+    slots = (11 - len(sbc["brickIndices"])) * copies
+    columns, rating = dominance_keys(sbc)
+    dominated = dominated_rows(df, columns, rating, slots)
+    add_log(
+        f"Dominance pruning removed {int(dominated.sum())} of {len(df)} rows "
+        f"(matching {', '.join(columns) or 'nothing'}, rating {rating or 'ignored'})"
+    )
+    return df[~dominated]
@@ -0,0 +1,134 @@
+"""
+Dynamic programming solver for rating-only SBCs in the Auto-SBC project
+"""
+import math
+from fractions import Fraction
+
+import numpy as np
+
+from .logger import add_log
+
+# Requirements the DP handles, PLAYER_QUALITY is applied as a filter before solving
+RATING_ONLY_REQUIREMENTS = ["TEAM_RATING", "PLAYER_QUALITY"]
+
+
+def is_rating_only(sbc):
+    """Whether the cheapest squad only has to reach a minimum team rating"""
+    keys = [req["requirementKey"] for req in sbc["constraints"]]
+    return (
+        "TEAM_RATING" in keys
+        and all(key in RATING_ONLY_REQUIREMENTS for key in keys)
+        and all(
+            req.get("scope") != "LOWER"
+            for req in sbc["constraints"]
+            if req["requirementKey"] == "TEAM_RATING"
+        )
+        and not sbc["brickIndices"]
+    )
+
+
+def _cards_by_rating(df, num_players):
+    """Rows of the cheapest differently named cards of each rating, cheapest first"""
+    cards = df[["name", "rating", "price"]].sort_values("price", kind="stable").drop_duplicates(["rating", "name"])
+    cards = cards[cards.groupby("rating").cumcount().to_numpy() < num_players]
+    groups = []
+    for rating, group in cards.groupby("rating", sort=True):
+        groups.append((int(rating), group.index.tolist(), group["price"].tolist()))
+    return groups
+
+
+def _knapsack(groups, num_players, max_total):
+    """Cheapest cost of every (players, total rating) after each rating group, with the cards taken"""
+    cost = np.full((num_players + 1, max_total + 1), np.inf)
+    cost[0, 0] = 0
+    tables = [(cost, None)]
+    for rating, _, prices in groups:
+        new_cost = cost.copy()
+        taken = np.zeros(cost.shape, dtype=np.int8)
+        prefix = np.cumsum([0] + prices)
+        for k in range(1, len(prefix)):
+            if k * rating > max_total:
+                break
+            candidate = cost[: num_players + 1 - k, : max_total + 1 - k * rating] + prefix[k]
+            better = candidate < new_cost[k:, k * rating:]
+            new_cost[k:, k * rating:][better] = candidate[better]
+            taken[k:, k * rating:][better] = k
+        cost = new_cost
+        tables.append((cost, taken))
+    return tables
+
+
+def _backtrack(tables, groups, players, total):
+    """Rows behind the (players, total) entry of the last table"""
+    rows = []
+    for (_, taken), (rating, group_rows, _) in zip(reversed(tables[1:]), reversed(groups)):
+        k = int(taken[players, total])
+        rows += group_rows[:k]
+        players -= k
+        total -= k * rating
+    return rows
+
+
+def _rounded_total(squad_rating, num_players):
+    """Smallest rounded total + excess that calc_squad_rating rates at least squad_rating"""
+    total = math.floor(Fraction(str(squad_rating)) * num_players) - 1
+    # The rating is rounded to 2 decimals, which can round a total just below up to it
+    while round(total / num_players, 2) < squad_rating:
+        total += 1
+    return total
+
+
+# Function to find the cheapest squad reaching a team rating
+def cheapest_squad(df, squad_rating, num_players=11):
+    """Rows of the cheapest squad whose rating reaches squad_rating, None if there is none.
+
+    The squad rating is total + sum(max(0, rating - total / 11)), so with the
+    average between h and h + 1 only the cards rated above h add an excess.
+    For every h the squad is split into the cards above h and the rest, each
+    side solved by a knapsack over (players, total rating) that takes the
+    cheapest cards of every rating.
+    """
+    groups = _cards_by_rating(df, num_players)
+    if not groups:
+        return None
+    ratings = [rating for rating, _, _ in groups]
+    max_total = num_players * max(ratings)
+    high_groups = groups[::-1]
+    high_tables = _knapsack(high_groups, num_players, max_total)
+    low_tables = _knapsack(groups, num_players, max_total)
+
+    # total + excess must round to the smallest total rated squad_rating, so
+    # 11 * (total + excess) must reach 11 * (that total - 0.5), scaled by the
+    # denominator of the target to stay in integers
+    target = _rounded_total(squad_rating, num_players) * 11 - Fraction(11, 2)
+    scale = target.denominator
+    players_high = np.arange(num_players + 1)
+    best = None
+    for h in range(num_players * min(ratings) // 11 - 1, max(ratings) + 1):
+        num_high = sum(1 for rating in ratings if rating > h)
+        high_cost = high_tables[num_high][0]
+        # Row p of low_cost is the cheapest rest of a squad with p cards above h
+        low_cost = low_tables[len(ratings) - num_high][0][::-1]
+        for total in range(11 * h + 1, min(11 * h + 11, max_total) + 1):
+            # 11 * total + 11 * total_high - total * players_high >= target
+            min_high = -((scale * (11 * total - total * players_high) - target.numerator) // (11 * scale))
+            # costs[p, t] of p cards above h with a total of t
+            costs = high_cost[:, : total + 1] + low_cost[:, total::-1]
+            costs[np.arange(total + 1) < min_high[:, None]] = np.inf
+            i = int(np.argmin(costs))
+            players, total_high = divmod(i, total + 1)
+            if costs[players, total_high] < np.inf and (best is None or costs[players, total_high] < best[0]):
+                best = (costs[players, total_high], num_high, players, total_high, total)
+
+    if best is None:
+        return None
+    _, num_high, players_high, total_high, total = best
+    rows = _backtrack(high_tables[: num_high + 1], high_groups[:num_high], players_high, total_high)
+    rows += _backtrack(
+        low_tables[: len(ratings) - num_high + 1],
+        groups[: len(ratings) - num_high],
+        num_players - players_high,
+        total - total_high,
+    )
+    add_log(f"Rating DP found a squad costing {int(best[0])}")
+    return rows
@@ -0,0 +1,107 @@
+"""
+Cached club rosters for the Auto-SBC project
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Most recently used rosters kept in memory
+MAX_ROSTERS = 8
+
+rosters = OrderedDict()
+rosters_lock = threading.Lock()
+
+
+class RosterError(Exception):
+    """The requested roster or version is not cached"""
+
+
+class Roster:
+    """Normalized club players of a client, indexed by player id"""
+
+    def __init__(self, roster_id, version, frame):
+        self.id = roster_id
+        self.version = version
+        self.frame = frame
+        self.updated = time.time()
+
+    def to_dict(self):
+        return {
+            "rosterId": self.id,
+            "version": self.version,
+            "players": len(self.frame),
+            "updated": self.updated,
+        }
+
+
+def normalize(players):
+    """json_normalize club players and index them by id"""
+    frame = pd.json_normalize(players)
+    if "id" in frame.columns:
+        frame = frame.set_index("id", drop=False)
+        frame.index.name = None
+    return frame
+
+
+def put(roster_id, version, players):
+    """Cache a full roster snapshot"""
+    roster = Roster(roster_id, version, normalize(players))
+    with rosters_lock:
+        rosters[roster_id] = roster
+        rosters.move_to_end(roster_id)
+        while len(rosters) > MAX_ROSTERS:
+            rosters.popitem(last=False)
+    return roster
+
+
+def apply_delta(roster_id, base_version, version, added=(), changed=(), removed=()):
+    """Update a cached roster with the players added, changed and removed since base_version"""
+    with rosters_lock:
+        roster = rosters.get(roster_id)
+        if roster is None:
+            raise RosterError(f"Roster {roster_id} is not cached")
+        if roster.version != base_version:
+            raise RosterError(
+                f"Roster {roster_id} is at version {roster.version}, not {base_version}"
+            )
+        frame = roster.frame
+        upserts = list(added) + list(changed)
+        drop_ids = list(removed)
+        if upserts:
+            upsert_frame = normalize(upserts)
+            drop_ids += upsert_frame.index.tolist()
+        frame = frame.drop(index=drop_ids, errors="ignore")
+        if upserts:
+            frame = pd.concat([frame, upsert_frame])
+        rosters[roster_id] = roster = Roster(roster_id, version, frame)
+        rosters.move_to_end(roster_id)
+        return roster
+
+
+def get(roster_id, version=None):
+    """Cached roster of roster_id, which must be at version when given"""
+    with rosters_lock:
+        roster = rosters.get(roster_id)
+        if roster is None:
+            raise RosterError(f"Roster {roster_id} is not cached")
+        if version is not None and roster.version != version:
+            raise RosterError(
+                f"Roster {roster_id} is at version {roster.version}, not {version}"
+            )
+        rosters.move_to_end(roster_id)
+        return roster
+
+
+def resolve_players(request_data):
+    """clubPlayers of a solve request and their roster key.
+
+    Requests referencing a cached roster get its frame and "<id>:<version>"
+    as the key, uploaded clubPlayers are returned as they are with no key.
+    """
+    if "clubPlayers" in request_data:
+        return request_data["clubPlayers"], None
+    reference = request_data["roster"]
+    roster = get(reference["id"], reference.get("version"))
+    return roster.frame.reset_index(drop=True), f"{roster.id}:{roster.version}"
@@ -1,19 +1,36 @@
 from . import optimize
+import hashlib
+import json
+import os
+import pickle
+import time
 import pandas as pd
 from fastapi import Response
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from .logger import add_log
+from . import artifacts
+from .cache import LRUCache
+from .pruning import group_codes, prune_dominated, pruning_mode
+from . import rating_dp
+from . import fodder
+
+# Boolean mask of the rows of a list column with any element in eligible
+def any_in(values, eligible):
+    exploded = pd.Series(values.to_numpy(), dtype=object).explode()
+    return exploded.isin(eligible).groupby(level=0).any().to_numpy()
+
 
 # Preprocess the club dataset obtained from api.
 
-def preprocess_data(df: pd.DataFrame,sbc):
-    df.to_csv("allPlayers.csv")
+def preprocess_data(df: pd.DataFrame,sbc,pruning="aggressive",copies=1):
+    artifacts.dump(df, "allPlayers")
     groupings=[]
     # Remove concept players with missing futggPrice
     df = df[~(df['concept'] & df['futggPrice'].isna())]
     df['price'] = df['price'].fillna(15000000)  # set price to 15m if missing so it will only use the player if really necessary
-    df = df[df['price'] <= 50000]                # remove players with price greater than 50k
+    if pruning == "aggressive":
+        df = df[df['price'] <= 50000]            # remove players with price greater than 50k
     expPP=False
     
     expPR=False
@@ -25,7 +42,7 @@ def preprocess_data(df: pd.DataFrame,sbc):
             add_log(f"Filtering players for '{req['requirementKey']}' requirement. Current player count: {len(df)}")
             if req['requirementKey'] == 'PLAYER_RARITY_GROUP':
                 # Filter players where any element in the groups array matches any eligibility value
-                df = df[df['groups'].apply(lambda x: any(g in req['eligibilityValues'] for g in x))]
+                df = df[any_in(df['groups'], req['eligibilityValues'])]
             elif req['requirementKey'] == 'PLAYER_QUALITY':
                 if req['scope'] == 'GREATER' or req['scope'] == 'EXACT':
                     df = df[df["ratingTier"] >= req['eligibilityValues'][0]]
@@ -90,57 +107,83 @@ def preprocess_data(df: pd.DataFrame,sbc):
         df = df.explode('groups')
     else:
         df = df.assign(groups=0)
-    # Select the cheapest players based on groupings
     groupings = list(set(groupings))  # Remove duplicates
     # Log the detected groupings
    
     add_log(f"Detected groupings for player filtering: {', '.join(groupings) if groupings else 'none'}")
-    # If groupings are defined, filter to keep the lowest priced players in each group
-    if groupings:
-        # Create a composite grouping key for each unique combination of grouping values
-        if len(groupings) > 0:
-            # Keep only the top 11 cheapest players for each unique grouping combination
-            # First, sort by price
-            df = df.sort_values('price')
-            
-            # Create a grouping key based on the identified groupings
-            if len(groupings) == 1:
-                group_key = df[groupings[0]].astype(str)
-            else:
-                group_key = df[groupings].apply(lambda x: '_'.join(x.astype(str)), axis=1)
-            
-            # Keep only the top 11 cheapest players for each group
-            df = df.groupby(group_key).head(11).reset_index(drop=True)
-            
-            print(f"Filtered to {len(df)} players after keeping top 11 cheapest per group")
-    df.to_csv("filteredPlayers.csv")
+    candidates = df
+    df = prune_players(df,sbc,pruning,groupings,copies)
+    # The cached CP-SAT model is built over a margin of pruned players as well,
+    # so re-solves whose pruning keeps a few other rows still fit it
+    if pruning != "none" and MODEL_MARGIN > 1:
+        add_log(f"Keeping {MODEL_MARGIN}x the players for the cached model")
+        candidates = prune_players(candidates,sbc,pruning,groupings,copies*MODEL_MARGIN)
+        candidates = pd.concat([df,candidates],ignore_index=True).drop_duplicates([column for column in optimize.MODEL_COLUMNS if column in df],ignore_index=True)
+    else:
+        candidates = None
+    artifacts.dump(df, "filteredPlayers")
     df['Original_Idx'] = df.index
     df = df.reset_index(drop = True)
 
+    return df,candidates
+
+
+def prune_players(df,sbc,pruning,groupings,copies=1):
+    """Players kept by the pruning mode for copies squads of the SBC"""
+    # Drop players that enough cheaper, equally useful players can always replace
+    if pruning != "none":
+        df = prune_dominated(df, sbc, copies)
+    # If groupings are defined, filter to keep the lowest priced players in each group
+    # The cut ignores the constraints outside the groupings, so only aggressive pruning uses it
+    if groupings and pruning == "aggressive":
+        # Keep only the top 11 cheapest players for each unique grouping combination
+        # First, sort by price
+        df = df.sort_values('price')
+        
+        # Create a grouping key based on the identified groupings
+        group_key = group_codes(df, groupings)
+        
+        # Keep only the top 11 cheapest players for each group, 11 per copy when solving several
+        df = df[df.groupby(group_key, sort=False).cumcount().to_numpy() < 11 * copies].reset_index(drop=True)
+        
+        print(f"Filtered to {len(df)} players after keeping top {11 * copies} cheapest per group")
     return df
 
 
-def runAutoSBC(sbc,players,maxSolveTime):
-    add_log("Starting SBC solver process")
-    # Log SBC configuration with dynamic key-value pairs
-    add_log("Starting SBC configuration processing:")
-    for key, value in sbc.items():
-        if isinstance(value, (list, dict)):
-            if isinstance(value, dict):
-                add_log(f"  {key}: Dictionary with {len(value)} items")
-                for k, v in value.items():
-                    add_log(f"    - {k}: {v}")
-            else:  # list
-                add_log(f"  {key}: List with {len(value)} items")
-                if len(value) <= 5:  # Limit output for large lists
-                    for item in value:
-                        add_log(f"    - {item}")
-                else:
-                    add_log(f"    - First 5 items: {value[:5]}")
-        else:
-            add_log(f"  {key}: {value}")
-    print(f"Processing SBC: {sbc['name'] if 'name' in sbc else 'Unknown SBC'}")
-    df = pd.json_normalize(players)
+# Pruned players kept in cached CP-SAT models, as a multiple of what a solve keeps
+MODEL_MARGIN = int(os.environ.get("AUTOSBC_MODEL_MARGIN", 2))
+# Preprocessed players keyed by (roster key, SBC signature, pruning mode)
+preprocess_cache = LRUCache(int(os.environ.get("AUTOSBC_PREPROCESS_CACHE_SIZE", 16)))
+
+
+def roster_signature(players):
+    """Hash of the club players uploaded with a solve.
+
+    Pickling is several times faster than JSON for a big club. The same
+    club sent with its keys in another order only misses the cache.
+    """
+    return hashlib.sha1(pickle.dumps(players, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def sbc_signature(sbc):
+    """The parts of an SBC that preprocessing depends on"""
+    return json.dumps(
+        [sbc['constraints'], sbc['formation'], sbc['brickIndices']], sort_keys=True, default=str
+    )
+
+
+@optimize.runtime
+def prepare_players(sbc, players, pruning="aggressive", copies=1):
+    """Normalize the club players and preprocess them for the SBC.
+
+    Returns the players to solve with and the players a new CP-SAT model
+    is built over (None for the same players).
+    """
+    # Cached rosters arrive already normalized
+    if isinstance(players, pd.DataFrame):
+        df = players
+    else:
+        df = pd.json_normalize(players)
     # Remove All Players not matching quality first
     df = df[df["price"] > 0]
     for req in sbc['constraints']:
@@ -167,15 +210,52 @@ def runAutoSBC(sbc,players,maxSolveTime):
         
         # Concatenate the original DataFrame with the brick DataFrame
         # df = pd.concat([df, brick_df], ignore_index=True)   
-    df = preprocess_data(df,sbc)
+    return preprocess_data(df,sbc,pruning,copies)
+
+
+def runAutoSBC(sbc,players,maxSolveTime,job=None,num_workers=None,solver_profile=None,roster_key=None,pruning=None,early_stop=None,copies=1):
+    add_log("Starting SBC solver process")
+    # Log SBC configuration with dynamic key-value pairs
+    add_log("Starting SBC configuration processing:")
+    for key, value in sbc.items():
+        if isinstance(value, (list, dict)):
+            if isinstance(value, dict):
+                add_log(f"  {key}: Dictionary with {len(value)} items")
+                for k, v in value.items():
+                    add_log(f"    - {k}: {v}")
+            else:  # list
+                add_log(f"  {key}: List with {len(value)} items")
+                if len(value) <= 5:  # Limit output for large lists
+                    for item in value:
+                        add_log(f"    - {item}")
+                else:
+                    add_log(f"    - First 5 items: {value[:5]}")
+        else:
+            add_log(f"  {key}: {value}")
+    print(f"Processing SBC: {sbc['name'] if 'name' in sbc else 'Unknown SBC'}")
+    pruning = pruning_mode(pruning)
+    add_log(f"Pruning mode: {pruning}")
+    copies = max(1, int(copies or 1))
+    # Repeat solves of the same challenge on the same club reuse the preprocessed players.
+    # Cached rosters come with their "<id>:<version>" key, only uploaded clubs are hashed
+    if roster_key is None and isinstance(players, list) and preprocess_cache.maxsize > 0:
+        roster_key = roster_signature(players)
+    cache_key = (roster_key, sbc_signature(sbc), pruning, copies) if roster_key is not None else None
+    cached = preprocess_cache.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        add_log(f"Using cached preprocessed players: {preprocess_cache.stats()}")
+        df,candidates = cached[0].copy(),cached[1]
+    else:
+        df,candidates = prepare_players(sbc, players, pruning, copies)
+        if cache_key is not None:
+            preprocess_cache.put(cache_key, (df.copy(),candidates))
+            add_log(f"Cached preprocessed players: {preprocess_cache.stats()}")
     add_log(f"Processing {len(players)} players for SBC")
     failed = False
     for req in sbc['constraints']:
         min_required = req.get('count', 0)
         if req['requirementKey'] == 'PLAYER_RARITY_GROUP':
-            condition = df['groups'].apply(
-                lambda g: any(item in req['eligibilityValues'] for item in (g if isinstance(g, list) else [g]))
-            )
+            condition = pd.Series(any_in(df['groups'], req['eligibilityValues']), index=df.index)
         elif req['requirementKey'] == 'PLAYER_QUALITY':
             if req.get('scope') in ['GREATER', 'EXACT']:
                 condition = df["ratingTier"] >= req['eligibilityValues'][0]
@@ -203,35 +283,203 @@ def runAutoSBC(sbc,players,maxSolveTime):
             failed = True
     if failed:
         add_log("One or more minimum requirements were not met.")
-    final_players,status,status_code = optimize.SBC(df,sbc,maxSolveTime)
+    if copies > 1:
+        return solve_copies(df,sbc,copies,maxSolveTime,job,num_workers,solver_profile,early_stop,pruning,failed,candidates)
+    final_players,status,status_code,solver,first_solution_time = solve_squad(df,sbc,maxSolveTime,job,num_workers,solver_profile,early_stop,failed,candidates)
     results=[]
     # if status != 2 and status != 4:
     #      return "{'status': {}, 'status_code': {}}".format(status, status_code)
     if final_players:
-        df_out = df.iloc[final_players].copy()
-        df_out.insert(5, 'Is_Pos', df_out.pop('Is_Pos'))
-        df_out.insert(6, 'Chemistry', df_out.pop('Chemistry'))
+        df_out = squad_frame(df,final_players)
         print(f"Total Chemistry: {df_out['Chemistry'].sum()}")
         squad_rating = calc_squad_rating(df_out["rating"].tolist())
         print(f"Squad Rating: {squad_rating}")
         print(f"Total Cost: {df_out['price'].sum()}")
-        df_out['Org_Row_ID'] = df_out['Original_Idx'] + 2
-        df_out.pop('Original_Idx')
-        df_out.to_csv("final_players.csv")
+        artifacts.dump(df_out, "final_players")
         print(sbc, status, status_code)
         results = df_out.to_json(orient="records")
         # add_log(f"Results: {results}")
         add_log(status)
-        json_compatible_item_data = jsonable_encoder({'results':results,'status':status,'status_code':status_code})
+        json_compatible_item_data = jsonable_encoder({'results':results,'status':status,'status_code':status_code,'pruning':pruning,'solver':solver,'first_solution_time':first_solution_time})
         return JSONResponse(content=json_compatible_item_data)
     add_log(status)
-    json_compatible_item_data = jsonable_encoder({'status':status,'status_code':status_code})
+    json_compatible_item_data = jsonable_encoder({'status':status,'status_code':status_code,'pruning':pruning,'solver':solver,'first_solution_time':first_solution_time})
     return JSONResponse(content=json_compatible_item_data)
 
 
 
 
 
+def solve_squad(df,sbc,maxSolveTime,job=None,num_workers=None,solver_profile=None,early_stop=None,failed=False,candidates=None):
+    """Rows of the cheapest squad with the status text and code, the solver used and the time to the first squad"""
+    # Rating-only SBCs are solved exactly by dynamic programming, everything else by CP-SAT
+    solve_start = time.time()
+    final_players = solve_rating_only(df,sbc) if rating_dp.is_rating_only(sbc) and not failed else None
+    if final_players:
+        solver = "dp"
+        status,status_code = optimize.status_dict[4],4
+        first_solution_time = time.time() - solve_start
+        df["Chemistry"] = 0
+        df["Is_Pos"] = 0
+    else:
+        solver = "cp-sat"
+        # Solution events carry the decoded squad, so /solver-best can return it during the solve
+        def describe_squad(rows,chemistry):
+            return squad_frame(df,rows,chemistry).to_json(orient="records")
+        final_players,status,status_code,first_solution_time = optimize.SBC(df,sbc,maxSolveTime,job,num_workers,solver_profile,early_stop=early_stop,describe_squad=describe_squad,candidates=candidates)
+    return final_players,status,status_code,solver,first_solution_time
+
+
+def solve_copies(df,sbc,copies,maxSolveTime,job=None,num_workers=None,solver_profile=None,early_stop=None,pruning=None,failed=False,candidates=None):
+    """Solve up to copies squads of a repeatable SBC that share no card, cheapest first.
+
+    Each copy is solved on the players left by the previous ones, so after
+    the first copy the cached model is reused with the used cards fixed out.
+    maxSolveTime is per copy.
+    """
+    used = set()
+    squads = []
+    status,status_code = optimize.status_dict[0],0
+    for copy in range(copies):
+        if optimize.is_cancelled(job):
+            add_log(f"Copies cancelled after {len(squads)} of {copies} copies")
+            break
+        remaining = df[~df['id'].isin(used)].reset_index(drop=True)
+        # Later copies can't start from the browser's current solution
+        copy_sbc = sbc if copy == 0 else {**sbc,'currentSolution':[None]*len(sbc['currentSolution'])}
+        add_log(f"Solving copy {copy+1} of {copies} without the {len(used)} cards used so far")
+        final_players,status,status_code,solver,first_solution_time = solve_squad(remaining,copy_sbc,maxSolveTime,job,num_workers,solver_profile,early_stop,failed,candidates)
+        if not final_players:
+            add_log(f"No squad for copy {copy+1}, stopping after {len(squads)} copies")
+            break
+        df_out = squad_frame(remaining,final_players)
+        used.update(df_out['id'])
+        squads.append({'results':df_out.to_json(orient="records"),'cost':int(df_out['price'].sum()),'status':status,'status_code':status_code,'solver':solver,'first_solution_time':first_solution_time})
+        add_log(f"Copy {copy+1} costs {squads[-1]['cost']}")
+    cost_curve = [squad['cost'] for squad in squads]
+    add_log(f"Solved {len(squads)} of {copies} copies for {sum(cost_curve)} in total")
+    # The first copy doubles as the single squad answer for older clients
+    first = squads[0] if squads else {'status':status,'status_code':status_code}
+    json_compatible_item_data = jsonable_encoder({**first,'copies':squads,'cost_curve':cost_curve,'total_cost':sum(cost_curve),'pruning':pruning})
+    return JSONResponse(content=json_compatible_item_data)
+
+
+# Default batch mode, overridden by batchMode in the /solve-batch payload
+BATCH_MODE = os.environ.get("AUTOSBC_BATCH_MODE", "sequential")
+BATCH_MODES = ["sequential", "joint"]
+
+
+def batch_mode(mode):
+    """Batch mode of a /solve-batch request.
+
+    sequential: solve the SBCs one after another, leaving out the cards already used
+    joint: solve all the SBCs in one CP-SAT model for the cheapest total
+    """
+    mode = mode or BATCH_MODE
+    if mode not in BATCH_MODES:
+        add_log(f"Unknown batch mode {mode}, using sequential")
+        mode = "sequential"
+    return mode
+
+
+def runBatchSBC(sbcs,players,maxSolveTime,job=None,num_workers=None,solver_profile=None,pruning=None,early_stop=None,mode=None):
+    """Solve the SBCs of a group on one club, never using a card in two of them.
+
+    maxSolveTime is per SBC, the joint model gets the time of all of them.
+    """
+    mode = batch_mode(mode)
+    pruning = pruning_mode(pruning)
+    add_log(f"Starting batch of {len(sbcs)} SBCs, mode: {mode}, pruning: {pruning}")
+    # Normalize the club once for every SBC
+    df = players if isinstance(players, pd.DataFrame) else pd.json_normalize(players)
+    challenges = []
+    if mode == "joint":
+        # Any challenge can take a card another one's pruning relied on, so every
+        # challenge keeps enough players for all the squad slots of the group
+        slots = sum(11-len(sbc['brickIndices']) for sbc in sbcs)
+        dfs = [prepare_players(sbc,df,pruning,-(-slots//(11-len(sbc['brickIndices']))))[0] for sbc in sbcs]
+        final_players,status,status_code,first_solution_time = optimize.SBC_batch(dfs,sbcs,maxSolveTime*len(sbcs),job,num_workers,solver_profile,early_stop=early_stop)
+        for sbc,df_sbc,rows in zip(sbcs,dfs,final_players):
+            df_out = squad_frame(df_sbc,rows)
+            challenges.append({'name':sbc.get('name'),'challengeId':sbc.get('challengeId'),'results':df_out.to_json(orient="records") if rows else None,'cost':int(df_out['price'].sum()),'status':status,'status_code':status_code,'first_solution_time':first_solution_time})
+    else:
+        used = set()
+        for sbc in sbcs:
+            if optimize.is_cancelled(job):
+                add_log(f"Batch cancelled after {len(challenges)} of {len(sbcs)} SBCs")
+                break
+            add_log(f"Solving {sbc.get('name', 'SBC')} without the {len(used)} cards used so far")
+            response = json.loads(runAutoSBC(sbc,df[~df['id'].isin(used)],maxSolveTime,job,num_workers,solver_profile,None,pruning,early_stop).body)
+            squad = json.loads(response['results']) if 'results' in response else []
+            used.update(player['id'] for player in squad)
+            challenges.append({'name':sbc.get('name'),'challengeId':sbc.get('challengeId'),'results':response.get('results'),'cost':sum(player['price'] for player in squad),'status':response['status'],'status_code':response['status_code'],'first_solution_time':response['first_solution_time']})
+    solved = sum(1 for challenge in challenges if challenge['results'])
+    total_cost = sum(challenge['cost'] for challenge in challenges)
+    add_log(f"Batch solved {solved} of {len(sbcs)} SBCs for {total_cost} in total")
+    json_compatible_item_data = jsonable_encoder({'challenges':challenges,'solved':solved,'total_cost':total_cost,'mode':mode,'pruning':pruning})
+    return JSONResponse(content=json_compatible_item_data)
+
+
+def runFodderPacking(targets,players):
+    """Spend the club on rating squads for bulk fodder SBCs, never using a card twice"""
+    targets = fodder.fodder_targets(targets)
+    add_log(f"Packing {len(targets)} fodder squads")
+    df = players if isinstance(players, pd.DataFrame) else pd.json_normalize(players)
+    df = df[df["price"] > 0]
+    df = df[~(df['concept'] & df['futggPrice'].isna())].reset_index(drop=True)
+    df['Original_Idx'] = df.index
+    df['Chemistry'] = 0
+    df['Is_Pos'] = 0
+    squads = []
+    for (squad_rating,min_rating),rows in zip(targets,fodder.pack_fodder(df,targets)):
+        if rows is None:
+            squads.append({'rating':squad_rating,'minRating':min_rating,'results':None,'cost':0,'squad_rating':None})
+            continue
+        df_out = squad_frame(df,rows)
+        squads.append({'rating':squad_rating,'minRating':min_rating,'results':df_out.to_json(orient="records"),'cost':int(df_out['price'].sum()),'squad_rating':calc_squad_rating(df_out['rating'].tolist())})
+    packed = sum(1 for squad in squads if squad['results'])
+    total_cost = sum(squad['cost'] for squad in squads)
+    add_log(f"Fodder packing filled {packed} of {len(targets)} squads for {total_cost} in total")
+    json_compatible_item_data = jsonable_encoder({'squads':squads,'packed':packed,'total_cost':total_cost})
+    return JSONResponse(content=json_compatible_item_data)
+
+
+def squad_frame(df,rows,chemistry=None):
+    """Card rows of a squad as the response returns them.
+
+    chemistry maps each row to its (Is_Pos, Chemistry), by default they are
+    read from the Is_Pos and Chemistry columns set by the solver.
+    """
+    df_out = df.iloc[rows].copy()
+    df_out = df_out[df_out['cardType'] != 'BRICK']
+    if chemistry is not None:
+        df_out['Is_Pos'] = [chemistry[row][0] for row in df_out.index]
+        df_out['Chemistry'] = [chemistry[row][1] for row in df_out.index]
+    df_out.insert(5, 'Is_Pos', df_out.pop('Is_Pos'))
+    df_out.insert(6, 'Chemistry', df_out.pop('Chemistry'))
+    df_out['Org_Row_ID'] = df_out['Original_Idx'] + 2
+    df_out.pop('Original_Idx')
+    return df_out
+
+
+def solve_rating_only(df,sbc):
+    """Rows of the cheapest squad for a rating-only SBC, None to fall back to CP-SAT"""
+    squad_rating = max(req['eligibilityValues'][0] for req in sbc['constraints'] if req['requirementKey'] == 'TEAM_RATING')
+    final_players = rating_dp.cheapest_squad(df, squad_rating)
+    if final_players is None:
+        add_log("Rating DP found no squad, falling back to CP-SAT")
+        return None
+    squad = df.iloc[final_players]
+    # Cards of the same player with different ratings can't be used together
+    if squad['name'].duplicated().any():
+        add_log("Rating DP squad repeats a player, falling back to CP-SAT")
+        return None
+    if calc_squad_rating(squad['rating'].tolist()) < squad_rating:
+        add_log("Rating DP squad misses the squad rating, falling back to CP-SAT")
+        return None
+    return final_players
+
+
 def calc_squad_rating(ratings):
     total_rating = sum(ratings)
     squad_size = len(ratings)
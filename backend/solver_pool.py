@@ -0,0 +1,195 @@
+"""
+Solver processes for the Auto-SBC project
+"""
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import logger
+from . import setup
+
+# CP-SAT search workers shared by all running solves
+TOTAL_SOLVER_WORKERS = int(os.environ.get("AUTOSBC_SOLVER_WORKERS", os.cpu_count() or 1))
+# Solves running at once, each in its own process. 0 solves in the calling thread.
+# At least 2, so a long solve doesn't queue every other request behind it
+SOLVER_PROCESSES = int(
+    os.environ.get("AUTOSBC_SOLVER_PROCESSES", max(2, TOTAL_SOLVER_WORKERS // 4))
+)
+
+_context = multiprocessing.get_context("spawn")
+_pool = None
+_manager = None
+_log_queue = None
+_pool_lock = threading.Lock()
+
+
+class RemoteJob:
+    """Stands in for a jobs.SolveJob inside a solver process"""
+
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+        self.done = threading.Event()
+
+    def cancelled(self):
+        """Whether the job has been asked to stop"""
+        return self.cancel_event.is_set()
+
+    def attach_callback(self, callback):
+        """Stop the search once the job is cancelled, returns False if it already was"""
+        if self.cancel_event.is_set():
+            return False
+
+        def watch():
+            while not self.done.is_set():
+                if self.cancel_event.wait(0.2):
+                    callback.StopSearch()
+                    return
+
+        threading.Thread(target=watch, daemon=True).start()
+        return True
+
+
+def worker_budget():
+    """CP-SAT workers of one solve, an equal share for each solver process.
+
+    The share is fixed rather than split between the solves running now,
+    so solves started one after another never add up to more workers than
+    TOTAL_SOLVER_WORKERS. Solving in the calling thread gets every worker.
+    """
+    return max(1, TOTAL_SOLVER_WORKERS // max(1, SOLVER_PROCESSES))
+
+
+def solve(request_data, stream_id, job=None):
+    """Run a /solve request and return the response content, logging to stream_id"""
+    logger.start_stream(stream_id)
+    logger.add_log("SBC Solver started in thread")
+
+    clubPlayers = request_data['clubPlayers']
+    maxSolveTime = request_data['maxSolveTime']
+
+    # Log received data
+    num_workers = worker_budget()
+    logger.add_log(
+        f"Processing {len(clubPlayers)} players, max time: {maxSolveTime}s, solver workers: {num_workers}"
+    )
+
+    try:
+        # /solve-batch payloads carry a list of SBCs instead of sbcData
+        if 'sbcBatch' in request_data:
+            result = setup.runBatchSBC(
+                request_data['sbcBatch'],
+                clubPlayers,
+                maxSolveTime,
+                job,
+                num_workers,
+                request_data.get('solverProfile'),
+                request_data.get('pruning'),
+                request_data.get('earlyStop'),
+                request_data.get('batchMode'),
+            )
+        else:
+            result = setup.runAutoSBC(
+                request_data['sbcData'],
+                clubPlayers,
+                maxSolveTime,
+                job,
+                num_workers,
+                request_data.get('solverProfile'),
+                request_data.get('rosterKey'),
+                request_data.get('pruning'),
+                request_data.get('earlyStop'),
+                request_data.get('copies'),
+            )
+
+        # Log completion
+        logger.add_log("Solver thread completed successfully")
+
+        return json.loads(result.body)
+    except Exception as e:
+        # Log errors
+        logger.add_log(f"Error in solver thread: {str(e)}")
+        raise e
+    finally:
+        logger.end_stream(stream_id)
+
+
+def _solve_in_process(request_data, stream_id, cancel_event):
+    job = RemoteJob(cancel_event) if cancel_event is not None else None
+    try:
+        return solve(request_data, stream_id, job)
+    finally:
+        if job is not None:
+            job.done.set()
+
+
+def _init_process(log_queue):
+    """Send this process's logs back to the server process"""
+    logger.forward_logs(log_queue)
+
+
+def _record_forwarded_logs(log_queue):
+    while True:
+        stream_id, entry = log_queue.get()
+        logger.record_log(stream_id, entry)
+
+
+def _get_pool():
+    global _pool, _manager, _log_queue
+    with _pool_lock:
+        if _pool is None:
+            if _manager is None:
+                _manager = _context.Manager()
+            if _log_queue is None:
+                _log_queue = _context.Queue()
+                threading.Thread(
+                    target=_record_forwarded_logs,
+                    args=(_log_queue,),
+                    name="solver-log-receiver",
+                    daemon=True,
+                ).start()
+            _pool = ProcessPoolExecutor(
+                max_workers=SOLVER_PROCESSES,
+                mp_context=_context,
+                initializer=_init_process,
+                initargs=(_log_queue,),
+            )
+        return _pool
+
+
+def run(request_data, stream_id, job=None):
+    """Solve request_data in a solver process and wait for the response content"""
+    global _pool
+    # Make this the latest stream before the solver process starts logging to it
+    logger.start_stream(stream_id)
+    if SOLVER_PROCESSES <= 0:
+        return solve(request_data, stream_id, job)
+
+    pool = _get_pool()
+    cancel_event = None
+    if job is not None:
+        cancel_event = _manager.Event()
+        job.attach_cancel_event(cancel_event)
+    try:
+        return pool.submit(_solve_in_process, request_data, stream_id, cancel_event).result()
+    except BrokenProcessPool:
+        # A solver process died, start a fresh pool for the next solve
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        logger.end_stream(stream_id)
+        raise
+
+
+def shutdown():
+    """Stop the solver processes without waiting for running solves"""
+    global _pool, _manager
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
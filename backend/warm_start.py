@@ -0,0 +1,216 @@
+"""
+Heuristic warm start for the Auto-SBC project
+"""
+import os
+import random
+import time
+from collections import Counter
+
+from .logger import add_log
+
+# Longest time spent looking for a warm start, at most a tenth of the solve time
+WARM_START_SECONDS = float(os.environ.get("AUTOSBC_WARM_START_SECONDS", 1.0))
+# Candidate rows tried per squad improvement step
+WARM_START_CANDIDATES = 200
+
+TEAM_TIERS = [2, 4, 7]
+LEAGUE_TIERS = [3, 5, 8]
+NATION_TIERS = [2, 5, 8]
+
+ID_COLUMNS = {
+    "CLUB_ID": "teamId",
+    "LEAGUE_ID": "leagueId",
+    "NATION_ID": "nationId",
+    "PLAYER_RARITY": "rarityId",
+    "PLAYER_RARITY_GROUP": "groups",
+    "PLAYER_LEVEL": "ratingTier",
+}
+SAME_COLUMNS = {
+    "SAME_CLUB_COUNT": "teamId",
+    "SAME_LEAGUE_COUNT": "leagueId",
+    "SAME_NATION_COUNT": "nationId",
+}
+UNIQUE_COLUMNS = {
+    "CLUB_COUNT": "teamId",
+    "LEAGUE_COUNT": "leagueId",
+    "NATION_COUNT": "nationId",
+}
+
+
+def _outside(value, bound, scope):
+    """How far value is from meeting bound under scope"""
+    if scope == "GREATER":
+        return max(0, bound - value)
+    if scope == "LOWER":
+        return max(0, value - bound)
+    return abs(value - bound)
+
+
+def _tier(count, tiers):
+    return sum(1 for threshold in tiers if count >= threshold)
+
+
+class SquadChecker:
+    """Scores squads against the requirements of an SBC the way optimize.SBC models them"""
+
+    def __init__(self, df, sbc):
+        self.sbc = sbc
+        self.columns = {
+            column: df[column].tolist()
+            for column in ["name", "teamId", "leagueId", "nationId", "possiblePositions",
+                           "groups", "rarityId", "rating", "ratingTier"]
+        }
+        self.price = df["price"].tolist()
+        self.formation = Counter(sbc["formation"])
+        self.chemistry = 0
+        self.chem_per_player = 0
+        for req in sbc["constraints"]:
+            if req["requirementKey"] == "CHEMISTRY_POINTS":
+                self.chemistry = req["eligibilityValues"][0]
+            if req["requirementKey"] == "ALL_PLAYERS_CHEMISTRY_POINTS":
+                self.chem_per_player = req["eligibilityValues"][0]
+
+    def cost(self, rows):
+        return sum(self.price[row] for row in rows)
+
+    def violation(self, rows):
+        """Total shortfall of the squad over every requirement, 0 when it is feasible"""
+        col = self.columns
+        names = [col["name"][row] for row in rows]
+        violation = len(names) - len(set(names))
+        for req in self.sbc["constraints"]:
+            key = req["requirementKey"]
+            values = req["eligibilityValues"]
+            scope = req.get("scope")
+            if key in ID_COLUMNS:
+                found = sum(1 for row in rows if col[ID_COLUMNS[key]][row] in values)
+                exact = key == "PLAYER_RARITY_GROUP" and scope == "EXACT"
+                violation += _outside(found, req["count"], "EXACT" if exact else "GREATER")
+            elif key in SAME_COLUMNS:
+                most = max(Counter(col[SAME_COLUMNS[key]][row] for row in rows).values())
+                if scope in ("LOWER", "EXACT"):
+                    violation += max(0, most - values[0])
+                if scope in ("GREATER", "EXACT"):
+                    violation += max(0, values[0] - most)
+            elif key in UNIQUE_COLUMNS:
+                distinct = len(set(col[UNIQUE_COLUMNS[key]][row] for row in rows))
+                violation += _outside(distinct, values[0], scope)
+            elif key == "PLAYER_MIN_OVR":
+                found = sum(1 for row in rows if col["rating"][row] >= values[0])
+                violation += _outside(found, req["count"], scope)
+            elif key == "PLAYER_MAX_OVR":
+                found = sum(1 for row in rows if col["rating"][row] <= values[0])
+                violation += _outside(found, req["count"], scope)
+            elif key == "PLAYER_EXACT_OVR":
+                found = sum(1 for row in rows if col["rating"][row] == values[0])
+                violation += _outside(found, req["count"], "EXACT")
+            elif key == "TEAM_RATING":
+                violation += self._rating_violation(rows, values[0], scope)
+        if self.chemistry or self.chem_per_player:
+            violation += self._chemistry_violation(rows)
+        return violation
+
+    def _rating_violation(self, rows, squad_rating, scope):
+        ratings = [self.columns["rating"][row] for row in rows]
+        total = sum(ratings)
+        # total + excess against squad_rating * players - 0.5, in 11ths of a rating point
+        rating = 11 * total + sum(max(0, 11 * rating - total) for rating in ratings)
+        target = 11 * squad_rating * len(rows) - 5.5
+        return _outside(rating, target, "LOWER" if scope == "LOWER" else "GREATER") / 11
+
+    def squad_chemistry(self, rows):
+        """Chemistry of each row placed in position, filling the formation in squad order"""
+        col = self.columns
+        open_slots = Counter(self.formation)
+        in_position = []
+        for row in rows:
+            position = col["possiblePositions"][row]
+            if open_slots[position] > 0:
+                open_slots[position] -= 1
+                in_position.append(row)
+        teams = Counter(col["teamId"][row] for row in in_position)
+        leagues = Counter(col["leagueId"][row] for row in in_position)
+        nations = Counter(col["nationId"][row] for row in in_position)
+        return {
+            row: min(
+                3,
+                _tier(teams[col["teamId"][row]], TEAM_TIERS)
+                + _tier(leagues[col["leagueId"][row]], LEAGUE_TIERS)
+                + _tier(nations[col["nationId"][row]], NATION_TIERS),
+            )
+            for row in in_position
+        }
+
+    def _chemistry_violation(self, rows):
+        chem = self.squad_chemistry(rows)
+        violation = max(0, self.chemistry - sum(chem.values()))
+        violation += sum(max(0, self.chem_per_player - chem.get(row, 0)) for row in rows)
+        return violation
+
+
+# Function to build a feasible squad quickly to hint the solver with
+def greedy_squad(df, sbc, max_seconds, describe_squad=None):
+    """Rows of a feasible squad found by greedy construction and local swaps, None if none was found.
+
+    Starts from the cheapest differently named players and repeatedly makes
+    the swap that most reduces the requirement shortfall, then the cost.
+    describe_squad is the squad decoder of optimize.SBC.
+    """
+    start = time.time()
+    num_players = 11 - len(sbc["brickIndices"])
+    by_price = df["price"].sort_values(kind="stable").index.tolist()
+    if len(by_price) < num_players:
+        return None
+    checker = SquadChecker(df, sbc)
+    names = checker.columns["name"]
+
+    squad = []
+    for row in by_price:
+        if names[row] not in {names[r] for r in squad}:
+            squad.append(row)
+            if len(squad) == num_players:
+                break
+    score = (checker.violation(squad), checker.cost(squad))
+
+    rng = random.Random(0)
+    cheapest = by_price[:WARM_START_CANDIDATES // 2]
+    while time.time() - start < max_seconds:
+        candidates = cheapest + rng.sample(by_price, min(len(by_price), WARM_START_CANDIDATES // 2))
+        taken = set(squad)
+        best = None
+        for row in candidates:
+            if row in taken:
+                continue
+            for i in range(num_players):
+                new_squad = squad[:i] + [row] + squad[i + 1:]
+                new_score = (checker.violation(new_squad), checker.cost(new_squad))
+                if new_score < score and (best is None or new_score < best[0]):
+                    best = (new_score, new_squad)
+        if best is None:
+            if score[0] == 0:
+                break
+            continue
+        score, squad = best
+
+    elapsed = round(time.time() - start, 2)
+    if score[0] > 0:
+        add_log(f"Warm start found no feasible squad in {elapsed}s")
+        return None
+    event = {
+        "type": "solution",
+        "solution_number": 0,
+        "objective_value": score[1],
+        "elapsed": elapsed,
+    }
+    if describe_squad is not None:
+        chemistry = {row: (0, 0) for row in squad}
+        if checker.chemistry or checker.chem_per_player:
+            chemistry.update((row, (1, points)) for row, points in checker.squad_chemistry(squad).items())
+        event["squad"] = describe_squad(squad, chemistry)
+    add_log(f"Warm start squad costing {score[1]} found in {elapsed}s", squad, event=event)
+    return squad
+
+
+def warm_start_seconds(maxSolveTime):
+    """Time budget of the warm start for a solve of maxSolveTime seconds"""
+    return min(WARM_START_SECONDS, maxSolveTime / 10)
@@ -0,0 +1,116 @@
+"""
+Benchmark payloads for the Auto-SBC project
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+# Formation slots and positions the synthetic players can play
+POSITIONS = [0, 3, 5, 7, 10, 12, 14, 16, 18, 23, 25, 27]
+RARITY_GROUPS = [0, 1, 2, 3, 4, 23]
+
+
+# Function to build a club that looks like the one the frontend sends
+def synthetic_club(size, seed):
+    """size club players drawn from seed, the same club on every run"""
+    rng = random.Random(seed)
+    players = []
+    for i in range(size):
+        rating = rng.randint(60, 91)
+        league = rng.randint(1, 15)
+        positions = rng.sample(POSITIONS, rng.randint(1, 3))
+        players.append({
+            "id": 1000 + i,
+            "name": f"Player {rng.randint(0, size)}",
+            "cardType": "Gold Rare" if rating >= 75 else "Silver Rare" if rating >= 65 else "Bronze Rare",
+            "assetId": 50000 + i,
+            "definitionId": 50000 + i,
+            "rating": rating,
+            "teamId": league * 100 + rng.randint(1, 12),
+            "leagueId": league,
+            "nationId": rng.randint(1, 40),
+            "rarityId": rng.choice([0, 1, 3]),
+            "ratingTier": 3 if rating >= 75 else 2 if rating >= 65 else 1,
+            "isUntradeable": True,
+            "isDuplicate": rng.random() < 0.2,
+            "isStorage": False,
+            "preferredPosition": positions[0],
+            "possiblePositions": positions,
+            "groups": rng.sample(RARITY_GROUPS, rng.randint(1, 2)),
+            "isFixed": False,
+            "concept": False,
+            "price": max(200, int((rating - 55) ** 2.5 * rng.uniform(0.7, 1.4))),
+            "futggPrice": None,
+            "maxChem": 3,
+        })
+    return players
+
+
+def load_payload(path):
+    """The /solve payload of a benchmark file.
+
+    Files can carry clubPlayers like a recorded request, or a
+    syntheticClub {"size", "seed"} that is generated here instead.
+    """
+    with open(path) as f:
+        payload = json.load(f)
+    if "clubPlayers" not in payload:
+        club = payload.pop("syntheticClub")
+        payload["clubPlayers"] = synthetic_club(club["size"], club["seed"])
+    return payload
+
+
+def payload_files(paths=None):
+    """Benchmark files to replay, every file of the payloads directory by default"""
+    if not paths:
+        return sorted(glob.glob(os.path.join(PAYLOAD_DIR, "*.json")))
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]
+    return files
+
+
+# Function to strip a recorded /solve payload of anything identifying the club
+def anonymize(payload):
+    """Copy of payload with card ids renumbered and player names hashed.
+
+    Names are hashed rather than dropped, since cards of the same player
+    can't be in a squad together. currentSolution keeps pointing at the
+    same cards.
+    """
+    players = payload["clubPlayers"]
+    asset_ids = {player.get("assetId"): 50000 + i for i, player in enumerate(players)}
+    club = []
+    for i, player in enumerate(players):
+        club.append({
+            **player,
+            "id": 1000 + i,
+            "name": hashlib.sha1(str(player["name"]).encode()).hexdigest()[:10],
+            "assetId": asset_ids[player.get("assetId")],
+            "definitionId": asset_ids[player.get("assetId")],
+        })
+    sbc = dict(payload["sbcData"])
+    sbc["currentSolution"] = [asset_ids.get(asset_id) for asset_id in sbc.get("currentSolution", [])]
+    return {
+        "sbcData": sbc,
+        "maxSolveTime": payload["maxSolveTime"],
+        "clubPlayers": club,
+        **{key: payload[key] for key in ["solverProfile", "pruning", "earlyStop"] if key in payload},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anonymize a recorded /solve payload for the benchmark corpus")
+    parser.add_argument("payload", help="JSON body of a /solve request")
+    parser.add_argument("output", help="Where to write the anonymized payload, e.g. benchmarks/payloads/<name>.json")
+    args = parser.parse_args()
+    with open(args.payload) as f:
+        recorded = json.load(f)
+    with open(args.output, "w") as f:
+        json.dump(anonymize(recorded), f)
+    print(f"Wrote {len(recorded['clubPlayers'])} anonymized players to {args.output}")
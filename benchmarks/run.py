@@ -0,0 +1,209 @@
+"""
+Benchmark runner for the Auto-SBC project
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import time
+import uuid
+
+from ortools import __version__ as ortools_version
+
+from backend import logger
+from backend import optimize
+from backend import setup
+
+from .corpus import load_payload, payload_files
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Log lines of the @runtime wrapper
+RUNTIME_LOG = re.compile(r"Processing time (\w+): ([\d.]+) seconds")
+# Columns of the CSV report, the JSON report also has the time of every @runtime function
+CSV_COLUMNS = [
+    "payload", "repeat", "sbc", "requirements", "rating_encoding", "players", "status", "status_code", "solver",
+    "objective", "solutions", "wall_seconds", "preprocess_seconds", "model_seconds", "model_source",
+    "first_feasible_seconds", "best_seconds",
+]
+
+
+def git_revision():
+    """Commit of the tree being benchmarked, with a + when it has uncommitted changes"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if dirty else "")
+
+
+def solve_metrics(entries):
+    """Timings of a solve read from its log entries"""
+    runtimes = {}
+    solutions = []
+    search_start = None
+    for entry in entries:
+        match = RUNTIME_LOG.fullmatch(entry["message"])
+        if match:
+            runtimes[match.group(1)] = round(runtimes.get(match.group(1), 0) + float(match.group(2)), 2)
+        elif entry["message"] == "Starting SBC solver" and search_start is None:
+            search_start = entry["time"]
+        event = entry.get("event") or {}
+        if event.get("type") == "solution":
+            solutions.append(entry)
+    best = None
+    for entry in solutions:
+        # Later solutions win ties, like /solver-best
+        if best is None or entry["event"]["objective_value"] <= best["event"]["objective_value"]:
+            best = entry
+    return {
+        "runtimes": runtimes,
+        "solutions": len(solutions),
+        "best_seconds": round(best["time"] - search_start, 2) if best and search_start else None,
+        "model_source": "cache" if "cached_model" in runtimes and "build_model" not in runtimes else (
+            "build" if "build_model" in runtimes else None
+        ),
+    }
+
+
+# Function to replay one benchmark payload
+def replay(path, num_workers, max_time=None, solver_profile=None, pruning=None, verbose=False, rating_encoding=None):
+    """Solve the payload of path with setup.runAutoSBC in this process and measure it.
+
+    The preprocessing and model caches are cleared first, so every run
+    starts cold like the first solve of a challenge. rating_encoding
+    overrides AUTOSBC_RATING_ENCODING for this run.
+    """
+    payload = load_payload(path)
+    sbc = payload["sbcData"]
+    setup.preprocess_cache.clear()
+    optimize.model_cache.clear()
+    default_encoding = optimize.RATING_ENCODING
+    optimize.RATING_ENCODING = rating_encoding or default_encoding
+    stream_id = f"benchmark-{uuid.uuid4().hex}"
+    logger.start_stream(stream_id)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.time()
+    try:
+        with output:
+            response = setup.runAutoSBC(
+                sbc,
+                payload["clubPlayers"],
+                max_time or payload["maxSolveTime"],
+                None,
+                num_workers,
+                solver_profile or payload.get("solverProfile"),
+                None,
+                pruning or payload.get("pruning"),
+                payload.get("earlyStop"),
+            )
+    finally:
+        wall_seconds = time.time() - start
+        logger.end_stream(stream_id)
+        optimize.RATING_ENCODING = default_encoding
+    result = json.loads(response.body)
+    metrics = solve_metrics(logger.get_logs(stream_id)["logs"])
+    squad = json.loads(result["results"]) if result.get("results") else []
+    first = result.get("first_solution_time")
+    runtimes = metrics["runtimes"]
+    return {
+        "payload": os.path.splitext(os.path.basename(path))[0],
+        "sbc": sbc.get("challengeName") or sbc.get("name"),
+        "requirements": " ".join(req["requirementKey"] for req in sbc["constraints"]),
+        "rating_encoding": rating_encoding or default_encoding,
+        "players": len(payload["clubPlayers"]),
+        "status": result["status"],
+        "status_code": result["status_code"],
+        "solver": result.get("solver"),
+        "objective": sum(player["price"] for player in squad) if squad else None,
+        "solutions": metrics["solutions"],
+        "wall_seconds": round(wall_seconds, 2),
+        "preprocess_seconds": runtimes.get("prepare_players"),
+        "model_seconds": runtimes.get("build_model", runtimes.get("cached_model")),
+        "model_source": metrics["model_source"],
+        "first_feasible_seconds": round(first, 2) if first is not None else None,
+        # The DP has no improving solutions, its first squad is the best one
+        "best_seconds": metrics["best_seconds"] if metrics["best_seconds"] is not None else (
+            round(first, 2) if first is not None else None
+        ),
+        "runtimes": runtimes,
+    }
+
+
+def seconds(value):
+    return "-" if value is None else f"{value}s"
+
+
+def write_report(report, out_dir):
+    """Save report as <revision>-<time>.json and .csv in out_dir, returns the JSON path"""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(report["started"]))
+    base = os.path.join(out_dir, f"{report['revision'] or 'unknown'}-{stamp}")
+    with open(base + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    with open(base + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["revision"] + CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for run in report["runs"]:
+            writer.writerow({"revision": report["revision"], **run})
+    return base + ".json"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded /solve payloads and report how fast they solve")
+    parser.add_argument("payloads", nargs="*", help="Payload files or directories (default: benchmarks/payloads)")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("AUTOSBC_SOLVER_WORKERS", os.cpu_count() or 1)),
+                        help="CP-SAT search workers per solve (default: AUTOSBC_SOLVER_WORKERS or the number of cores)")
+    parser.add_argument("--max-time", type=float, help="Override the maxSolveTime of every payload")
+    parser.add_argument("--profile", help="Solver profile for payloads that don't set solverProfile")
+    parser.add_argument("--pruning", help="Pruning mode for payloads that don't set pruning")
+    parser.add_argument("--rating-encoding", action="append", choices=["excess", "total"],
+                        help="TEAM_RATING encoding, repeat it to solve every payload with each (default: AUTOSBC_RATING_ENCODING)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each payload (default: 1)")
+    parser.add_argument("--out", default=RESULTS_DIR, help="Directory of the JSON and CSV reports (default: benchmarks/results)")
+    parser.add_argument("--verbose", action="store_true", help="Show the solver output")
+    args = parser.parse_args(argv)
+
+    files = payload_files(args.payloads)
+    if not files:
+        parser.error("no benchmark payloads found")
+    report = {
+        "revision": git_revision(),
+        "started": time.time(),
+        "python": platform.python_version(),
+        "ortools": ortools_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "max_time": args.max_time,
+        "runs": [],
+    }
+    print(f"Benchmarking {len(files)} payloads at {report['revision']} with {args.workers} workers")
+    for path in files:
+        for rating_encoding in args.rating_encoding or [None]:
+            for repeat in range(args.repeat):
+                run = replay(path, args.workers, args.max_time, args.profile, args.pruning, args.verbose, rating_encoding)
+                run["repeat"] = repeat
+                report["runs"].append(run)
+                print(
+                    f"{run['payload']:<24} {run['rating_encoding']:<7} {run['status'].split(':')[0]:<10} objective {run['objective']} "
+                    f"first {seconds(run['first_feasible_seconds'])} best {seconds(run['best_seconds'])} "
+                    f"preprocess {seconds(run['preprocess_seconds'])} model {seconds(run['model_seconds'])} "
+                    f"wall {seconds(run['wall_seconds'])}"
+                )
+    print(f"Report written to {write_report(report, args.out)}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
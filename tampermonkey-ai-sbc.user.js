@@ -4903,6 +4903,7 @@ const hideLoader = () => {
     loaderIcon.style.display = 'block';
   }
   clearInterval(logPollInterval);
+  stopSolverLogStream();
   clearInterval(countDownInterval);
 };
 const showNotification = function (message, type = UINotificationType.POSITIVE) {
@@ -5411,7 +5412,104 @@ let getSBCPrice = (item, sbcId = 0, challengeId = 0) => {
 };
 let countDownInterval;
 let logPollInterval;
+let solveJobId;
 let createSbc = true;
+
+// Poll a background solve job until it ends, returning its /solve response
+const waitForSolveJob = async (jobId) => {
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    let job;
+    try {
+      job = JSON.parse(await makeGetRequest(apiUrl + '/jobs/' + jobId));
+    } catch (error) {
+      console.error('Error polling solve job:', error);
+      return { status: 'Lost the connection to the backend', status_code: 0 };
+    }
+    if (!job.status) {
+      // Jobs only live in the backend's memory, so a restart forgets them
+      return { status: 'The backend restarted during the solve, please solve again', status_code: 0 };
+    }
+    if (job.status === 'completed') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      return { status: job.error, status_code: 0 };
+    }
+    if (job.status === 'cancelled') {
+      return job.result || { status: 'Solve cancelled', status_code: 0 };
+    }
+  }
+};
+
+// Club last uploaded to the backend's roster cache: its version and each player's JSON by id
+let uploadedRoster;
+
+const getRosterId = () => {
+  let rosterId = localStorage.getItem('autoSbcRosterId');
+  if (!rosterId) {
+    rosterId = 'club-' + Math.random().toString(36).slice(2);
+    localStorage.setItem('autoSbcRosterId', rosterId);
+  }
+  return rosterId;
+};
+
+// Send a JSON body, resolving to whether the backend accepted it
+const sendJsonRequest = (method, url, data) =>
+  fetch(url, { method: method, body: data })
+    .then((response) => response.ok)
+    .catch(() => false);
+
+// Bring the backend's cached roster up to date with players, returning its { id, version }
+// The club is uploaded once, later solves only send the players that changed
+const syncRoster = async (players) => {
+  const rosterId = getRosterId();
+  const rosterUrl = apiUrl + '/roster/' + encodeURIComponent(rosterId);
+  const current = new Map(players.map((player) => [player.id, JSON.stringify(player)]));
+  const version = String(Date.now());
+  if (uploadedRoster) {
+    const added = players.filter((player) => !uploadedRoster.players.has(player.id));
+    const changed = players.filter(
+      (player) =>
+        uploadedRoster.players.has(player.id) &&
+        uploadedRoster.players.get(player.id) !== current.get(player.id)
+    );
+    const removed = [...uploadedRoster.players.keys()].filter((playerId) => !current.has(playerId));
+    if (added.length + changed.length + removed.length === 0) {
+      // Unchanged, unless the backend restarted and lost it
+      try {
+        const cached = JSON.parse(await makeGetRequest(rosterUrl));
+        if (cached.version === uploadedRoster.version) {
+          return { id: rosterId, version: uploadedRoster.version };
+        }
+      } catch (error) {
+        console.error('Error checking the cached roster:', error);
+      }
+    } else if (
+      await sendJsonRequest(
+        'PATCH',
+        rosterUrl,
+        JSON.stringify({ baseVersion: uploadedRoster.version, version, added, changed, removed })
+      )
+    ) {
+      uploadedRoster = { version, players: current };
+      return { id: rosterId, version };
+    }
+  }
+  if (!(await sendJsonRequest('PUT', rosterUrl, JSON.stringify({ version, clubPlayers: players })))) {
+    uploadedRoster = null;
+    return null;
+  }
+  uploadedRoster = { version, players: current };
+  return { id: rosterId, version };
+};
+
+// Stop the CP-SAT search of the running solve
+const cancelSolveJob = () => {
+  if (solveJobId) {
+    fetch(apiUrl + '/jobs/' + solveJobId, { method: 'DELETE' }).catch((error) => console.log(error));
+  }
+};
 let concepts = false;
 let solveSBC = async (sbcId, challengeId, autoSubmit = false, repeat = null, autoOpen = false, tryNext = true) => {
   if (createSbc != true) {
@@ -5564,8 +5662,10 @@ let solveSBC = async (sbcId, challengeId, autoSubmit = false, repeat = null, aut
       };
     });
 
+  // Send the cached roster instead of the whole club when the backend has it
+  const roster = await syncRoster(backendPlayersInput);
   const input = JSON.stringify({
-    clubPlayers: backendPlayersInput,
+    ...(roster ? { roster: roster } : { clubPlayers: backendPlayersInput }),
     sbcData: sbcData,
     maxSolveTime: getSettings(sbcId, sbcData.challengeId, 'maxSolveTime'),
   });
@@ -5575,16 +5675,20 @@ let solveSBC = async (sbcId, challengeId, autoSubmit = false, repeat = null, aut
   clearInterval(countDownInterval);
   countDownInterval = setInterval(countDown, 1000);
 
-  // Reset log index and start polling
+  // Reset log index and start streaming once the job is queued
   lastLogIndex = 0;
-  logPollInterval = setInterval(pollSolverLogs, 1000);
   showLoader(true);
-  let solution = await makePostRequest(apiUrl + '/solve', input);
-
-  // Stop polling when solve is complete
+  const job = await makePostRequest(apiUrl + '/jobs', input);
+  solveJobId = job.job_id;
+  streamSolverLogs(job.job_id);
+  let solution = await waitForSolveJob(job.job_id);
+  solveJobId = null;
+
+  // Stop streaming when solve is complete
+  stopSolverLogStream();
   clearInterval(logPollInterval);
   clearInterval(countDownInterval);
-  pollSolverLogs();
+  pollSolverLogs(job.job_id);
   if (createSbc != true) {
     hideLoader();
     showNotification('SBC Stopped');
@@ -8929,6 +9033,7 @@ const createStopOverlayButton = () => {
   stopButton.addEventListener('click', () => {
     createSbc = false;
     createSbcGrind = false;
+    cancelSolveJob();
     hideLoader();
     // fetch(apiUrl + "/stop-solver", {
     //     method: "POST"
@@ -9028,14 +9133,17 @@ const updateLogOverlay = () => {
 // Setup a variable to track the last log we've seen
 let lastLogIndex = 0;
 
-// Function to poll for solver logs
-const pollSolverLogs = async () => {
+// Function to poll for the logs of a solve
+const pollSolverLogs = async (jobId) => {
   if (!getSettings(0, 0, 'showLogOverlay')) {
     return; // Don't poll if log overlay is disabled
   }
 
   try {
-    const response = await makeGetRequest(apiUrl + '/solver-logs');
+    // Only ask for the logs added since the last poll
+    const response = await makeGetRequest(
+      apiUrl + '/solver-logs?job=' + encodeURIComponent(jobId) + '&since=' + lastLogIndex
+    );
     const data = JSON.parse(response);
 
     // We have new logs
@@ -9045,24 +9153,14 @@ const pollSolverLogs = async () => {
         logOverlay.removeChild(logOverlay.firstChild);
       }
     }
-    if (data.logs && data.logs.length > lastLogIndex) {
+    if (data.logs && data.logs.length > 0) {
       if (logOverlay) {
         // Add new logs to the overlay
-        for (let i = lastLogIndex; i < data.logs.length; i++) {
-          const log = data.logs[i];
-          const timestamp = new Date(log.time * 1000).toISOString().split('T')[1].slice(0, -1);
-
-          const logEntry = document.createElement('div');
-          logEntry.className = 'solver-log';
-
-          if (log.message) {
-            logEntry.textContent = `${timestamp}: ${log.message}`;
-          }
-
-          logOverlay.insertBefore(logEntry, logOverlay.firstChild);
+        for (let i = 0; i < data.logs.length; i++) {
+          addSolverLogEntry(logOverlay, data.logs[i]);
         }
 
-        lastLogIndex = data.logs.length;
+        lastLogIndex = data.next;
       }
     }
   } catch (error) {
@@ -9070,6 +9168,62 @@ const pollSolverLogs = async () => {
   }
 };
 
+const addSolverLogEntry = (logOverlay, log) => {
+  const timestamp = new Date(log.time * 1000).toISOString().split('T')[1].slice(0, -1);
+
+  const logEntry = document.createElement('div');
+  logEntry.className = 'solver-log';
+
+  if (log.message) {
+    logEntry.textContent = `${timestamp}: ${log.message}`;
+  }
+
+  logOverlay.insertBefore(logEntry, logOverlay.firstChild);
+};
+
+let solverEventSource;
+
+const stopSolverLogStream = () => {
+  if (solverEventSource) {
+    solverEventSource.close();
+    solverEventSource = null;
+  }
+};
+
+// Stream the logs of a solve as they happen, falling back to polling
+const streamSolverLogs = (jobId) => {
+  stopSolverLogStream();
+  if (!getSettings(0, 0, 'showLogOverlay')) {
+    return;
+  }
+  if (typeof EventSource === 'undefined') {
+    logPollInterval = setInterval(() => pollSolverLogs(jobId), 1000);
+    return;
+  }
+  const logOverlay = document.getElementById('sbc-log-overlay');
+  if (logOverlay) {
+    while (logOverlay.firstChild) {
+      logOverlay.removeChild(logOverlay.firstChild);
+    }
+  }
+  solverEventSource = new EventSource(apiUrl + '/solver-events?job=' + encodeURIComponent(jobId));
+  const onSolverEvent = (event) => {
+    const log = JSON.parse(event.data);
+    lastLogIndex = log.seq;
+    const overlay = document.getElementById('sbc-log-overlay');
+    if (overlay) {
+      addSolverLogEntry(overlay, log);
+    }
+  };
+  solverEventSource.addEventListener('log', onSolverEvent);
+  solverEventSource.addEventListener('solution', onSolverEvent);
+  solverEventSource.addEventListener('done', stopSolverLogStream);
+  solverEventSource.onerror = () => {
+    stopSolverLogStream();
+    logPollInterval = setInterval(() => pollSolverLogs(jobId), 1000);
+  };
+};
+
 let initDefaultSettings = () => {
   Object.keys(defaultSBCSolverSettings).forEach((id) =>
     saveSettings(0, 0, id, getSettings(0, 0, id) ?? defaultSBCSolverSettings[id])
@@ -9382,6 +9536,7 @@ function Counter(selector, settings) {
     counterContent.classList.add('numCounter');
     counterContent.addEventListener('click', () => {
       createSbc = false;
+      cancelSolveJob();
       hideLoader();
     });
     shield.appendChild(counterContent);
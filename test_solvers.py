@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+# Check the solver shortcuts against exact answers on tiny clubs.
+# Every club is drawn from a fixed seed, so runs are repeatable.
+import contextlib
+import copy
+import itertools
+import os
+import random
+import sys
+
+import pandas as pd
+
+from backend import fodder, optimize, rating_dp, setup
+
+FORMATION = [0, 3, 5, 5, 7, 12, 14, 14, 18, 25, 27]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the solver output, CP-SAT writes its log straight to the stdout file"""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+def tiny_club(size, seed):
+    """size club players with few leagues, nations and ratings, so buckets fill up"""
+    rng = random.Random(seed)
+    players = []
+    for i in range(size):
+        rating = rng.randint(74, 86)
+        league = rng.randint(1, 2)
+        players.append({
+            "id": 1000 + i,
+            # Some cards share a player, like the versions of a player in a real club
+            "name": f"Player {rng.randint(0, size * 4 // 5)}",
+            "cardType": "Gold Rare",
+            "assetId": 50000 + i,
+            "definitionId": 50000 + i,
+            "rating": rating,
+            "teamId": league * 10 + rng.randint(1, 2),
+            "leagueId": league,
+            "nationId": rng.randint(1, 2),
+            "rarityId": rng.choice([1, 3]),
+            "ratingTier": 3,
+            "isUntradeable": True,
+            "isDuplicate": False,
+            "isStorage": False,
+            "preferredPosition": FORMATION[i % 11],
+            "possiblePositions": [FORMATION[i % 11]],
+            "groups": rng.sample([0, 1, 4], rng.randint(1, 2)),
+            "isFixed": False,
+            "concept": False,
+            "price": max(200, int((rating - 70) ** 2.5 * rng.uniform(0.3, 3.0))),
+            "futggPrice": None,
+            "maxChem": 3,
+        })
+    return players
+
+
+def challenge(constraints):
+    return {
+        "name": "test",
+        "formation": FORMATION,
+        "brickIndices": [],
+        "currentSolution": [None] * 11,
+        "constraints": constraints,
+    }
+
+
+# Requirement sets whose attributes the dominance filter compares
+PRUNING_CHALLENGES = {
+    "team rating": [
+        {"scope": "GREATER", "count": -1, "requirementKey": "TEAM_RATING", "eligibilityValues": [81]},
+    ],
+    "leagues and min ovr": [
+        {"scope": "LOWER", "count": -1, "requirementKey": "SAME_LEAGUE_COUNT", "eligibilityValues": [7]},
+        {"scope": "GREATER", "count": 4, "requirementKey": "PLAYER_MIN_OVR", "eligibilityValues": [82]},
+    ],
+    "nations and rarity": [
+        {"scope": "GREATER", "count": -1, "requirementKey": "NATION_COUNT", "eligibilityValues": [2]},
+        {"scope": "GREATER", "count": 3, "requirementKey": "PLAYER_RARITY", "eligibilityValues": [3]},
+    ],
+}
+
+
+def cheapest_cost(players, sbc, pruning):
+    """Cost of the squad CP-SAT proves cheapest after pruning, None if it proves nothing"""
+    with quiet():
+        df, _ = setup.prepare_players(copy.deepcopy(sbc), players, pruning)
+        optimize.model_cache.clear()
+        rows, _, status_code, _ = optimize.SBC(df, copy.deepcopy(sbc), 30, num_workers=1)
+    if status_code != 4:
+        return None, len(df)
+    return int(df.loc[rows, "price"].sum()), len(df)
+
+
+def check_dominance_pruning(seeds=range(8), size=60):
+    """Safe pruning must keep the cheapest squad CP-SAT finds on the whole club"""
+    failures = 0
+    for name, constraints in PRUNING_CHALLENGES.items():
+        sbc = challenge(constraints)
+        for seed in seeds:
+            players = tiny_club(size, seed)
+            full, full_rows = cheapest_cost(players, sbc, "none")
+            pruned, pruned_rows = cheapest_cost(players, sbc, "safe")
+            if full == pruned:
+                cost = "no squad" if full is None else full
+                print(f"✅ {name}, club {seed}: {cost} with {pruned_rows} of {full_rows} rows")
+            else:
+                print(f"❌ {name}, club {seed}: {pruned} after pruning, {full} without")
+                failures += 1
+    return failures
+
+
+def brute_force_squad(cards, squad_rating, num_players=11):
+    """(cost, rows) of the cheapest squad of differently named cards reaching squad_rating, by trying them all"""
+    names = cards["name"].tolist()
+    ratings = cards["rating"].tolist()
+    prices = cards["price"].tolist()
+    best = None
+    with quiet():
+        for squad in itertools.combinations(range(len(cards)), num_players):
+            cost = sum(prices[i] for i in squad)
+            if best is not None and cost >= best[0]:
+                continue
+            if len({names[i] for i in squad}) < num_players:
+                continue
+            if setup.calc_squad_rating([ratings[i] for i in squad]) >= squad_rating:
+                best = (cost, [cards.index[i] for i in squad])
+    return best
+
+
+def check_rating_dp(seeds=range(10), size=17, targets=(78, 80, 81.5)):
+    """The rating DP must find the cheapest squad, with a rating calc_squad_rating accepts"""
+    failures = 0
+    for seed in seeds:
+        cards = pd.DataFrame(tiny_club(size, seed))
+        # The DP leaves repeated players to its callers, so every card is its own player here
+        cards["name"] = cards["id"].astype(str)
+        for target in targets:
+            with quiet():
+                rows = rating_dp.cheapest_squad(cards, target)
+                reached = setup.calc_squad_rating(cards.loc[rows, "rating"].tolist()) if rows else None
+            cost = int(cards.loc[rows, "price"].sum()) if rows else None
+            best = brute_force_squad(cards, target)
+            expected = best[0] if best else None
+            if cost != expected:
+                print(f"❌ rating {target}, club {seed}: DP costs {cost}, brute force {expected}")
+                failures += 1
+            elif rows is not None and (len(rows) != 11 or reached < target):
+                print(f"❌ rating {target}, club {seed}: DP squad of {len(rows)} rates {reached}")
+                failures += 1
+            else:
+                print(f"✅ rating {target}, club {seed}: {'no squad' if cost is None else cost}")
+    return failures
+
+
+# (rating, minRating) targets packed together, the first leaves too few cards for a second squad
+FODDER_TARGETS = [((80, 0), (76, 0)), ((78, 77),)]
+
+
+def check_fodder_packing(seeds=range(6), size=22):
+    """Every fodder squad must be the cheapest one left, of different players and cards"""
+    failures = 0
+    for seed, targets in itertools.product(seeds, FODDER_TARGETS):
+        # Repeated names are kept, the packer must not put a player in a squad twice
+        cards = pd.DataFrame(tiny_club(size, seed))
+        with quiet():
+            squads = fodder.pack_fodder(cards, list(targets))
+        used = set()
+        for (target, min_rating), rows in zip(targets, squads):
+            pool = cards[~cards.index.isin(used) & (cards["rating"] >= min_rating)]
+            best = brute_force_squad(pool, target)
+            expected = best[0] if best else None
+            cost = int(cards.loc[rows, "price"].sum()) if rows else None
+            if cost != expected:
+                print(f"❌ fodder {target} from {min_rating}, club {seed}: packed for {cost}, brute force {expected}")
+                failures += 1
+            elif rows is not None and (used & set(rows) or cards.loc[rows, "name"].duplicated().any()):
+                print(f"❌ fodder {target} from {min_rating}, club {seed}: squad reuses a card or a player")
+                failures += 1
+            else:
+                print(f"✅ fodder {target} from {min_rating}, club {seed}: {'no squad' if cost is None else cost}")
+            used.update(rows or [])
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_dominance_pruning()
+    failures += check_rating_dp()
+    failures += check_fodder_packing()
+    print(f"{failures} failures")
+    sys.exit(1 if failures else 0)